@@ -1,24 +1,49 @@
 """
 Synthesis Model Benchmark
 
-Benchmarks different models for feedback synthesis quality, speed, and cost.
+Benchmarks different models for feedback synthesis quality, speed (time to
+first token and total latency), and cost.
 
 Usage:
     uv run python benchmark_synthesis.py
+    uv run python benchmark_synthesis.py --batch   # openai/* models via Batch API
+    uv run python benchmark_synthesis.py --no-cache
+    uv run python benchmark_synthesis.py --refresh-model openai/gpt-5.2
+
+Synthesis outputs are cached in .bench_cache/ keyed by (model, temperature,
+prompt), and judge responses in results/judge_cache.sqlite keyed by (judge
+model, prompt), so reruns with unchanged prompts make no API calls.
 
 Requires:
     OPENROUTER_API_KEY environment variable (or .env file)
+
+Optional:
+    OPENAI_API_KEY - needed for --batch (OpenRouter has no batch endpoint)
 """
 
-import json
+import argparse
+import asyncio
+import copy
+import functools
+import hashlib
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import httpx
+import aiohttp
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows; fall back to the stock loop
+    uvloop = None
+
 # Load .env file
 load_dotenv(Path(__file__).parent / ".env")
 
@@ -30,8 +55,24 @@ from deepeval.metrics import GEval
 from deepeval.models import DeepEvalBaseLLM
 from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 
-# OpenRouter API
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+from openrouter import (
+    OPENROUTER_API_URL,
+    AdaptiveSemaphore,
+    JudgeCache,
+    JudgeModelCache,
+    LoopLimiters,
+    close_session,
+    close_sync_session,
+    get_session,
+    iter_sse_chunks,
+    json_schema_format,
+    post_with_retry,
+    read_judge_content,
+    run_sync,
+)
+
+# OpenAI API - only used by --batch, since OpenRouter has no batch endpoint
+OPENAI_API_BASE = "https://api.openai.com/v1"
 
 # Models to benchmark for synthesis
 SYNTHESIS_MODELS = [
@@ -44,328 +85,72 @@ SYNTHESIS_MODELS = [
 # Judge model for evaluation
 JUDGE_MODEL = "anthropic/claude-opus-4.5"
 
+# Starting (and maximum) judge requests in flight per judge model; the limit
+# backs off on 429s and recovers on success. Expensive models get less room.
+MAX_CONCURRENCY = {
+    "anthropic/claude-opus-4.5": 12,
+}
+DEFAULT_MAX_CONCURRENCY = 32
+
+# Max (model, test case) pairs in flight at once - keeps us under OpenRouter rate limits
+CONCURRENCY = 20
+
+# Workers per model queue, so each model's cases reach the provider back to
+# back (better prompt-cache reuse) while CONCURRENCY still caps the total
+N_WORKERS = 8
+
+# Judge consumers scoring finished syntheses, and how many finished syntheses
+# may wait for them before synthesis workers pause
+JUDGE_WORKERS = 16
+JUDGE_QUEUE_SIZE = 32
+
+# Seconds between batch job status checks
+BATCH_POLL_SECONDS = 10
+
+# Default executor size, for file I/O and any sync-only DeepEval measure() calls
+EXECUTOR_THREADS = 32
+
+# On-disk cache of synthesis responses
+CACHE_DIR = Path(__file__).parent / ".bench_cache"
+
+# Scored (model, case) records, appended as they finish so an interrupted
+# run can resume; removed once a run completes without errors
+CHECKPOINT_FILE = Path(__file__).parent / "results" / "checkpoint.jsonl"
+
 
 # -----------------------------------------------------------------------------
 # Test Cases (exported from Convex dev)
 # -----------------------------------------------------------------------------
 
-TEST_CASES = [
-    {
-        "id": "hamlet-analysis",
-        "essay_title": "Character Analysis: Hamlet's Internal Conflicts",
-        "essay_content": """In William Shakespeare's tragic play "Hamlet," the titular character undergoes a profound psychological journey that has fascinated audiences and scholars for over four centuries. Prince Hamlet of Denmark is not a simple hero seeking revenge; he is a deeply conflicted individual torn between action and contemplation, duty and morality, certainty and doubt. This essay argues that Hamlet's internal conflicts—particularly his struggle between the obligation to avenge his father and his philosophical questioning of that obligation—define his character and ultimately lead to his tragic fate.""",
-        "rubric": """Literary Analysis (40%) - Demonstrates deep understanding of character psychology
-Textual Evidence (30%) - Selects appropriate quotes, integrates smoothly
-Organization & Writing (20%) - Clear thesis, logical structure
-MLA Format (10%) - Correct citations""",
-        "grader_feedback": [
-            {
-                "model": "x-ai/grok-4",
-                "percentage": 92,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Strong Thesis Statement", "description": "The thesis effectively establishes a two-pronged argument about Hamlet's internal conflicts.", "evidence": "The introduction explicitly states the essay's argument about duty vs philosophical questioning."},
-                        {"title": "Effective Use of Textual Evidence", "description": "Powerful and relevant quotes directly support the analysis of Hamlet's paralysis.", "evidence": "The use of 'the native hue of resolution / Is sicklied o'er with the pale cast of thought' effectively underpins the argument."},
-                        {"title": "Insightful Character Analysis", "description": "Goes beyond plot summary to explore psychological motivations.", "evidence": "Analysis of prayer scene shows good grasp of moral procrastination."}
-                    ],
-                    "improvements": [
-                        {"title": "Word Count and Depth", "description": "Essay is approximately 600 words, falling short of 800-1000 requirement.", "suggestion": "Expand analysis of the Gravedigger scene and compare Act 1 vs Act 5."},
-                        {"title": "Quote Integration", "description": "Some quotes are 'floating' rather than woven grammatically.", "suggestion": "Practice the 'weave' method where quotes become grammatical parts of sentences."}
-                    ]
-                }
-            },
-            {
-                "model": "google/gemini-3-pro-preview",
-                "percentage": 82,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Clear Argument Structure", "description": "Essay presents conflicts in logical progression.", "evidence": "Movement from ghost encounter to prayer scene to resolution."},
-                        {"title": "Understanding of Themes", "description": "Demonstrates grasp of action vs contemplation theme.", "evidence": "Discussion of Hamlet's philosophical nature."}
-                    ],
-                    "improvements": [
-                        {"title": "Deeper Textual Analysis", "description": "Could analyze language patterns more closely.", "suggestion": "Examine Hamlet's soliloquies for shifts in imagery and tone."},
-                        {"title": "Secondary Conflicts", "description": "Gertrude/Ophelia section feels rushed.", "suggestion": "Connect treatment of women to internal duty conflict."},
-                        {"title": "Conclusion Strength", "description": "Ending is somewhat general.", "suggestion": "Reference specific examples in concluding synthesis."}
-                    ]
-                }
-            },
-            {
-                "model": "openai/gpt-5.2",
-                "percentage": 90,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Sophisticated Thesis", "description": "Thesis is specific and arguable, directly addressing the prompt.", "evidence": "Clear statement about conflicts defining character and leading to tragedy."},
-                        {"title": "Prayer Scene Analysis", "description": "Excellent analysis of Hamlet's moral reasoning.", "evidence": "Discussion of waiting for Claudius's soul to be damned."},
-                        {"title": "Academic Tone", "description": "Maintains appropriate scholarly register throughout.", "evidence": "Consistent formal language and analytical approach."}
-                    ],
-                    "improvements": [
-                        {"title": "Length Requirement", "description": "Below word count limits depth of analysis.", "suggestion": "Develop the resolution phase more thoroughly."},
-                        {"title": "MLA Citations", "description": "Act/scene/line citations need consistent formatting.", "suggestion": "Use (3.1.84-85) format consistently throughout."}
-                    ]
-                }
-            }
-        ]
-    },
-    {
-        "id": "industrial-revolution",
-        "essay_title": "The Impact of the Industrial Revolution on 19th Century Britain",
-        "essay_content": """The Industrial Revolution, which began in Britain in the late 18th century, marked one of the most significant turning points in human history. While historians have long debated its precise origins and timeline, there is little dispute about its profound and lasting effects on British society and economy. This essay argues that the Industrial Revolution fundamentally restructured British life, creating both unprecedented economic opportunities and severe social dislocations that would define the character of modern industrial society.""",
-        "rubric": """Thesis - Clear, specific, arguable thesis that guides the essay
-Evidence - Extensive use of primary and secondary sources
-Analysis - Deep analysis connecting evidence to thesis
-Structure - Excellent organization with smooth transitions
-Citations - Perfect Chicago style formatting""",
-        "grader_feedback": [
-            {
-                "model": "x-ai/grok-4",
-                "percentage": 78,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Clear Narrative Flow", "description": "Essay maintains compelling narrative voice throughout.", "evidence": "Smooth transition from economic changes to social consequences."},
-                        {"title": "Strong Use of Historical Data", "description": "Includes specific statistics that ground arguments.", "evidence": "Manchester population growth from 25,000 to 300,000."},
-                        {"title": "Balance of Topics", "description": "Successfully addresses both social and economic impacts.", "evidence": "Equal coverage of factory system, urbanization, and class emergence."}
-                    ],
-                    "improvements": [
-                        {"title": "Citation Format", "description": "Chicago style citations missing.", "suggestion": "Add footnotes for every statistic and quote."},
-                        {"title": "Primary Sources", "description": "Mentions Engels but doesn't quote directly.", "suggestion": "Include direct quotes from factory inspector reports."},
-                        {"title": "Thesis Specificity", "description": "Thesis is somewhat generic.", "suggestion": "Take a more specific stance on the nature of restructuring."}
-                    ]
-                }
-            },
-            {
-                "model": "google/gemini-3-pro-preview",
-                "percentage": 78,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Sophisticated Vocabulary", "description": "Strong command of academic language.", "evidence": "Phrases like 'severe social dislocations' and 'industrial proletariat'."},
-                        {"title": "Historical Knowledge", "description": "Demonstrates solid understanding of major shifts.", "evidence": "Correct identification of urbanization and factory system."}
-                    ],
-                    "improvements": [
-                        {"title": "Word Count", "description": "Essay is significantly shorter than required 1500 words.", "suggestion": "Expand existing points with more case studies."},
-                        {"title": "Bibliography Required", "description": "No bibliography provided.", "suggestion": "Create bibliography listing all sources consulted."},
-                        {"title": "Primary Source Usage", "description": "Underutilizes primary documents.", "suggestion": "Quote from Sadler Committee Report or Chartist petitions."}
-                    ]
-                }
-            },
-            {
-                "model": "anthropic/claude-opus-4.5",
-                "percentage": 74,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Historiographical Engagement", "description": "References both contemporary observers and later historians.", "evidence": "Mentions Hobsbawm, Engels, Adam Smith, and Marx."},
-                        {"title": "Effective Balance", "description": "Dedicates appropriate space to economic and social analysis.", "evidence": "Roughly equal coverage of both dimensions."}
-                    ],
-                    "improvements": [
-                        {"title": "Citations Missing", "description": "No Chicago-style footnotes present.", "suggestion": "Add footnotes for all factual claims and quotes."},
-                        {"title": "Conclusion Synthesis", "description": "Conclusion summarizes but doesn't fully synthesize.", "suggestion": "Return to specific evidence while maintaining broader synthesis."},
-                        {"title": "Transitions", "description": "Movement between sections somewhat abrupt.", "suggestion": "Add transitional sentences connecting economic to social."}
-                    ]
-                }
-            }
-        ]
-    },
-    {
-        "id": "legal-advice-1",
-        "essay_title": "Employment Tribunal Advice – Harassment and Unfair Dismissal Claims",
-        "essay_content": """Task 1: Letter of Advice
-
-Firm 3
-Campus, Glasney Lodge, Penryn TR10 9FE
-
-To: Mr Duncan Goode
-Date: 14 May 2025
-Subject: Employment Tribunal Advice – Harassment and Unfair Dismissal Claims
-
-Dear Mr Goode,
-
-Thank you for contacting us in relation to your Employment Tribunal claim. This letter sets out our advice regarding the legal claims you are pursuing against Cann Abel Solicitors. As the hearing has not yet taken place, the purpose of this letter is to advise you on the relevant law, potential remedies, and what to expect.""",
-        "rubric": """Analysis/argument - critically analyse and apply legal concepts, develop reasoned argument
-Knowledge/understanding - accurate knowledge, explain and apply sources
-Use of materials/research - locate and engage with sources, proper OSCOLA
-Presentation - clear, logical structure, concise language""",
-        "grader_feedback": [
-            {
-                "model": "x-ai/grok-4",
-                "percentage": 65,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Clear Legal Issue Identification", "description": "Successfully identifies harassment and unfair dismissal claims.", "evidence": "Sections correctly separate claims under s.26 EqA 2010 and s.94 ERA 1996."},
-                        {"title": "Relevant Case Law", "description": "Integrates appropriate authorities.", "evidence": "References to Driskel, Reed v Stedman, and Burchell."},
-                        {"title": "Practical Remedies Discussion", "description": "Addresses Vento bands and financial losses.", "evidence": "Section 6 outlines remedy brackets clearly."}
-                    ],
-                    "improvements": [
-                        {"title": "OSCOLA Referencing", "description": "Citations not in proper footnote format.", "suggestion": "Add full OSCOLA footnotes for every case and statute."},
-                        {"title": "Professional Tone", "description": "Some informal phrasing remains.", "suggestion": "Ensure letter flows as professional document."},
-                        {"title": "Grammar Issues", "description": "Comma splices and run-on sentences present.", "suggestion": "Proofread for sentence boundaries."}
-                    ]
-                }
-            },
-            {
-                "model": "google/gemini-3-pro-preview",
-                "percentage": 58,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Issue Spotting", "description": "Identifies core legal framework correctly.", "evidence": "Distinguishes between different types of harassment claims."},
-                        {"title": "Case Integration", "description": "Uses relevant authorities.", "evidence": "Appropriate selection of ET cases."}
-                    ],
-                    "improvements": [
-                        {"title": "OSCOLA Format", "description": "Missing proper footnotes.", "suggestion": "Implement full OSCOLA citation in footnotes."},
-                        {"title": "Reflective Depth", "description": "Part B analysis is descriptive rather than analytical.", "suggestion": "Use Gibbs cycle to structure reflection."},
-                        {"title": "Letter Structure", "description": "Introduction contains fragments.", "suggestion": "Ensure opening paragraph is grammatically complete."},
-                        {"title": "Proofreading", "description": "Multiple typos present.", "suggestion": "Final proofread for spelling and grammar."}
-                    ]
-                }
-            },
-            {
-                "model": "openai/gpt-5.2",
-                "percentage": 60,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Legal Framework", "description": "Correctly applies statutory provisions.", "evidence": "Accurate breakdown of EqA 2010 sections."},
-                        {"title": "Honest Reflection", "description": "Part A shows genuine self-awareness.", "evidence": "Discussion of ADHD challenges is authentic."}
-                    ],
-                    "improvements": [
-                        {"title": "Citation Style", "description": "OSCOLA not properly implemented.", "suggestion": "Use footnotes with full case citations."},
-                        {"title": "Analysis Depth", "description": "Could expand on ACAS Code implications.", "suggestion": "Reference ACAS Code for procedural fairness."},
-                        {"title": "Language Register", "description": "Informal contractions in reflection.", "suggestion": "Maintain academic register throughout."}
-                    ]
-                }
-            }
-        ]
-    },
-    {
-        "id": "legal-advice-2",
-        "essay_title": "Legal Advice on Mediation Settlements in Road Accident Claims",
-        "essay_content": """**Gen AI Declaration**
-
-AI-supported use is permitted in this assessment. I acknowledge the use of GenAI tools for developing ideas and research.
+# One test case per line: id, essay_title, essay_content, rubric, grader_feedback
+TEST_CASES_FILE = Path(__file__).parent / "data" / "benchmark_cases.jsonl"
 
-**Letter of Advice**
 
-Re: Mediation Settlement - Road Accident Claim
+def load_test_cases(path: Path = TEST_CASES_FILE) -> list[dict]:
+    """Load benchmark test cases from a JSONL file."""
+    return [orjson.loads(line) for line in path.read_bytes().splitlines() if line.strip()]
 
-Dear Client,
 
-Following our recent consultation regarding your road traffic accident claim, I write to provide formal advice on the mediation settlement proposal received from the defendant's insurers.""",
-        "rubric": """Analysis/argument - critically analyse legal concepts, develop reasoned argument
-Knowledge/understanding - accurate knowledge of tort law and procedure
-Use of materials - engage with sources, proper OSCOLA referencing
-Presentation - clear structure, professional format""",
-        "grader_feedback": [
-            {
-                "model": "x-ai/grok-4",
-                "percentage": 78,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Clear Structure", "description": "Logical progression through liability, damages, and advice.", "evidence": "Distinct headings guide reader through analysis."},
-                        {"title": "Accurate Legal Principles", "description": "Correctly identifies primary/secondary victim distinction.", "evidence": "Proper application of Alcock control mechanisms."},
-                        {"title": "Commercial Awareness", "description": "Addresses practical litigation risks.", "evidence": "Discussion of costs and trial uncertainty."}
-                    ],
-                    "improvements": [
-                        {"title": "Citation Mechanics", "description": "Repetitive footnotes instead of cross-references.", "suggestion": "Use 'ibid' or 'Case Name (n X)' for subsequent citations."},
-                        {"title": "Client Tone", "description": "Occasionally too academic.", "suggestion": "Move case names to footnotes, explain principles plainly."},
-                        {"title": "Damages Basis", "description": "Specific figures appear hypothetical.", "suggestion": "Use JCG ranges rather than invented numbers."}
-                    ]
-                }
-            },
-            {
-                "model": "google/gemini-3-pro-preview",
-                "percentage": 65,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Legal Accuracy", "description": "Sound understanding of negligence principles.", "evidence": "Correct duty of care analysis."},
-                        {"title": "Professional Format", "description": "Appropriate letter structure.", "evidence": "Clear headings and client address."}
-                    ],
-                    "improvements": [
-                        {"title": "OSCOLA Compliance", "description": "Footnotes missing or incomplete.", "suggestion": "Add full citations for all authorities."},
-                        {"title": "Primary Victim Analysis", "description": "Could be more detailed.", "suggestion": "Expand on foreseeability requirements."},
-                        {"title": "Quantum Discussion", "description": "Needs more precision.", "suggestion": "Reference specific JCG brackets."}
-                    ]
-                }
-            },
-            {
-                "model": "anthropic/claude-opus-4.5",
-                "percentage": 72,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Logical Organization", "description": "Well-structured analysis framework.", "evidence": "Clear progression from liability to remedies."},
-                        {"title": "Appropriate Hedging", "description": "Uses appropriate legal caveats.", "evidence": "Phrases like 'on balance' and 'subject to evidence'."}
-                    ],
-                    "improvements": [
-                        {"title": "Source Integration", "description": "Some footnotes contain text not sources.", "suggestion": "Ensure footnotes are strictly for authorities."},
-                        {"title": "String Citations", "description": "Avoid citing multiple cases without purpose.", "suggestion": "Each citation should add distinct value."},
-                        {"title": "Formatting Consistency", "description": "Some inconsistent styling.", "suggestion": "Review document for uniform presentation."}
-                    ]
-                }
-            }
-        ]
-    },
-    {
-        "id": "constitutional-law",
-        "essay_title": "Comparative Constitutional Analysis: UK and South Africa",
-        "essay_content": """This essay examines the fundamental differences between the constitutional frameworks of the United Kingdom and South Africa, focusing on the separation of powers doctrine and mechanisms for executive accountability. While both nations share a common law heritage, their approaches to constitutional supremacy and judicial review diverge significantly.""",
-        "rubric": """Analysis - critically analyse constitutional concepts and comparative frameworks
-Knowledge - accurate understanding of both constitutional systems
-Research - engage with primary sources and academic commentary
-Presentation - logical structure, proper OSCOLA citations""",
-        "grader_feedback": [
-            {
-                "model": "x-ai/grok-4",
-                "percentage": 65,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Comparative Framework", "description": "Consistently juxtaposes both systems.", "evidence": "Section 2 explicitly contrasts UK fusion vs SA separation."},
-                        {"title": "Case Law Usage", "description": "Good selection from both jurisdictions.", "evidence": "Uses Doctors for Life, EFF, Jackson, and Miller II."},
-                        {"title": "Theoretical Engagement", "description": "Incorporates academic perspectives.", "evidence": "References Dicey, Bagehot, and Kavanagh."}
-                    ],
-                    "improvements": [
-                        {"title": "Analysis Depth", "description": "Sometimes stops at description.", "suggestion": "Critically evaluate effectiveness of each system."},
-                        {"title": "Terminology Precision", "description": "Some conceptual imprecision.", "suggestion": "Use 'partial separation' rather than 'fusion'."},
-                        {"title": "Proofreading", "description": "Capitalization and typos present.", "suggestion": "Check 'Uk' vs 'UK' and other errors."}
-                    ]
-                }
-            },
-            {
-                "model": "google/gemini-3-pro-preview",
-                "percentage": 62,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Structural Clarity", "description": "Clear organization of comparison.", "evidence": "Distinct sections for each jurisdiction."},
-                        {"title": "Source Range", "description": "Uses variety of authorities.", "evidence": "Mix of cases and academic commentary."}
-                    ],
-                    "improvements": [
-                        {"title": "Critical Analysis", "description": "More description than evaluation.", "suggestion": "Analyze why checks failed in examples given."},
-                        {"title": "Grammar", "description": "Run-on sentences and comma splices.", "suggestion": "Use semicolons to join independent clauses."},
-                        {"title": "Academic Tone", "description": "Some informal phrasing.", "suggestion": "Avoid 'To end off' - use 'In conclusion'."},
-                        {"title": "Capitalization", "description": "Inconsistent proper noun formatting.", "suggestion": "Capitalize 'Parliament' and 'Constitution' consistently."}
-                    ]
-                }
-            },
-            {
-                "model": "anthropic/claude-opus-4.5",
-                "percentage": 65,
-                "feedback": {
-                    "strengths": [
-                        {"title": "Balanced Coverage", "description": "Equal attention to both systems.", "evidence": "Neither jurisdiction dominates the analysis."},
-                        {"title": "Key Cases Identified", "description": "Selects important constitutional decisions.", "evidence": "Miller II and EFF are central authorities."}
-                    ],
-                    "improvements": [
-                        {"title": "Deeper Critique", "description": "Could evaluate downsides of judicial dominance.", "suggestion": "Consider tension with democratic mandate."},
-                        {"title": "Citation Format", "description": "OSCOLA not fully implemented.", "suggestion": "Add proper footnotes with neutral citations."},
-                        {"title": "Conclusion Strength", "description": "Ending is somewhat brief.", "suggestion": "Synthesize implications more fully."}
-                    ]
-                }
-            }
-        ]
-    }
-]
+TEST_CASES = load_test_cases()
 
 
 # -----------------------------------------------------------------------------
 # Synthesis Prompt
 # -----------------------------------------------------------------------------
 
-SYNTHESIS_PROMPT_TEMPLATE = """You are synthesizing feedback from {num_graders} independent essay graders.
+def render_synthesis_prompt(
+    num_graders: int,
+    essay_title: str,
+    rubric: str,
+    essay_content: str,
+    grader_feedback_xml: str,
+) -> str:
+    """Fill in the synthesis prompt.
+
+    A plain f-string rather than a str.format template, so rendering doesn't
+    re-parse format fields on every call.
+    """
+    return f"""You are synthesizing feedback from {num_graders} independent essay graders.
 
 <assignment>
 <title>{essay_title}</title>
@@ -405,25 +190,71 @@ Output in markdown format with ## headers for each section.
 
 def format_grader_feedback_xml(grader_feedback: list[dict]) -> str:
     """Format grader feedback as XML for the synthesis prompt."""
-    xml_parts = []
-    for i, grader in enumerate(grader_feedback, 1):
-        feedback_json = json.dumps(grader["feedback"], indent=2)
-        xml_parts.append(
-            f'<grader_{i} model="{grader["model"]}" percentage="{grader["percentage"]}">\n'
-            f'{feedback_json}\n'
-            f'</grader_{i}>'
+    # Encode every grader's feedback up front, then assemble in a single join
+    encoded = [
+        (
+            grader["model"],
+            grader["percentage"],
+            orjson.dumps(grader["feedback"], option=orjson.OPT_INDENT_2).decode(),
         )
-    return "\n\n".join(xml_parts)
+        for grader in grader_feedback
+    ]
+    return "\n\n".join(
+        f'<grader_{i} model="{model}" percentage="{percentage}">\n{feedback_json}\n</grader_{i}>'
+        for i, (model, percentage, feedback_json) in enumerate(encoded, 1)
+    )
+
+
+def build_prompt(test_case: dict, grader_feedback_xml: str | None = None) -> str:
+    """Render the synthesis prompt for a test case.
+
+    Pass an already formatted `grader_feedback_xml` to avoid rebuilding it.
+    """
+    if grader_feedback_xml is None:
+        grader_feedback_xml = format_grader_feedback_xml(test_case["grader_feedback"])
+    return render_synthesis_prompt(
+        num_graders=len(test_case["grader_feedback"]),
+        essay_title=test_case["essay_title"],
+        rubric=test_case["rubric"],
+        essay_content=test_case["essay_content"],
+        grader_feedback_xml=grader_feedback_xml,
+    )
+
+
+# -----------------------------------------------------------------------------
+# Sync Runner
+# -----------------------------------------------------------------------------
+
+class SyncRunnerMixin:
+    """Per-request timeout plus the background loop for sync callers."""
+
+    request_timeout: float = 180.0
+
+    @property
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.request_timeout)
+
+    def _run_sync(self, coro):
+        return run_sync(coro)
+
+    def close(self):
+        """Close the session used by sync callers; it reopens on next use."""
+        close_sync_session()
 
 
 # -----------------------------------------------------------------------------
 # OpenRouter Client
 # -----------------------------------------------------------------------------
 
-class OpenRouterClient:
+class OpenRouterClient(SyncRunnerMixin):
     """Client for making OpenRouter API calls with timing and cost tracking."""
 
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        cache_dir: Path | None = None,
+        refresh_models: frozenset[str] = frozenset(),
+    ):
         self.api_key = api_key
         self.headers = {
             "Authorization": f"Bearer {api_key}",
@@ -431,93 +262,350 @@ class OpenRouterClient:
             "HTTP-Referer": "https://markm8.com",
             "X-Title": "MarkM8 Synthesis Benchmark",
         }
-
-    def generate(self, model: str, prompt: str, temperature: float = 0.3) -> dict:
-        """Generate a response and return content, time, and cost."""
-        start_time = time.time()
+        # None disables caching; refresh_models bypass lookups but still store
+        self.cache_dir = cache_dir
+        self.refresh_models = refresh_models
+        # One task per distinct request this run, so duplicates share a single call
+        self._requests: dict[str, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "OpenRouterClient":
+        await get_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # The session is shared per loop, so this also closes it for the judge
+        await close_session()
+
+    @staticmethod
+    def _request_key(model: str, prompt: str, temperature: float) -> str:
+        return hashlib.sha256(f"{model}|{temperature}|{prompt}".encode()).hexdigest()
+
+    def _cache_path(self, key: str) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / f"{key}.json"
+
+    async def generate_async(self, model: str, prompt: str, temperature: float = 0.3) -> dict:
+        """Stream a response and return content, timings, and cost.
+
+        time_seconds is end-to-end latency and ttft_seconds the time to the
+        first content token. Cache hits return the stored response with
+        cached=True and both timings zeroed so they can be left out of
+        latency stats. Identical requests within a run share one call; all
+        but the first are also reported as cached.
+        """
+        key = self._request_key(model, prompt, temperature)
+        task = self._requests.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            result = await asyncio.shield(task)
+            return {**result, "cached": True, "time_seconds": 0.0, "ttft_seconds": 0.0}
+
+        task = asyncio.ensure_future(self._generate(model, prompt, temperature, key))
+        self._requests[key] = task
+        try:
+            return await asyncio.shield(task)
+        except BaseException:
+            # Let a later call retry rather than replaying the failure
+            if task.done() and self._requests.get(key) is task:
+                del self._requests[key]
+            raise
+
+    async def _generate(self, model: str, prompt: str, temperature: float, key: str) -> dict:
+        cache_file = self._cache_path(key)
+        if cache_file is not None and model not in self.refresh_models and cache_file.exists():
+            result = orjson.loads(cache_file.read_bytes())
+            result["cached"] = True
+            result["time_seconds"] = 0.0
+            result["ttft_seconds"] = 0.0
+            return result
+
+        start_ns = time.perf_counter_ns()
 
         payload = {
             "model": model,
             "messages": [{"role": "user", "content": prompt}],
             "temperature": temperature,
+            "stream": True,
         }
 
-        with httpx.Client(timeout=180.0) as client:
-            response = client.post(OPENROUTER_API_URL, headers=self.headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-
-        elapsed_time = time.time() - start_time
-        content = data["choices"][0]["message"]["content"]
-
-        # Extract cost from usage if available
-        usage = data.get("usage", {})
-        # OpenRouter returns cost in the response
-        cost = None
-        if "cost" in usage:
-            cost = usage["cost"]
-
-        return {
-            "content": content,
-            "time_seconds": elapsed_time,
-            "cost": cost,
+        parts = []
+        ttft_ns = None
+        usage = {}
+        async with post_with_retry(
+            OPENROUTER_API_URL, label=model, headers=self.headers, json=payload, timeout=self.timeout
+        ) as response:
+            async for chunk in iter_sse_chunks(response, label=model):
+                if chunk.get("usage"):
+                    # OpenRouter sends usage (including cost) on the final chunk
+                    usage = chunk["usage"]
+                if chunk.get("choices"):
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        if ttft_ns is None:
+                            ttft_ns = time.perf_counter_ns() - start_ns
+                        parts.append(delta)
+
+        elapsed_ns = time.perf_counter_ns() - start_ns
+        result = {
+            "content": "".join(parts),
+            "start_ns": start_ns,
+            "elapsed_ns": elapsed_ns,
+            "ttft_ns": ttft_ns,
+            "time_seconds": elapsed_ns / 1e9,
+            "ttft_seconds": ttft_ns / 1e9 if ttft_ns is not None else None,
+            "cost": usage.get("cost"),
             "tokens": usage.get("total_tokens"),
         }
 
+        if cache_file is not None:
+            cache_file.parent.mkdir(exist_ok=True)
+            cache_file.write_bytes(orjson.dumps(result))
+
+        return result
+
+    def generate(self, model: str, prompt: str, temperature: float = 0.3) -> dict:
+        """Blocking wrapper around generate_async for sync callers."""
+        return self._run_sync(self.generate_async(model, prompt, temperature))
+
+
+class OpenAIBatchClient(SyncRunnerMixin):
+    """Runs synthesis prompts through OpenAI's Batch API at ~50% of the sync price.
+
+    OpenRouter has no batch endpoint, so this talks to OpenAI directly and only
+    covers openai/* models. Batch jobs complete within 24h and carry no
+    per-request latency, so their results have time_seconds=None.
+    """
+
+    request_timeout = 600.0
+
+    def __init__(self, api_key: str):
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    @staticmethod
+    def supports(model: str) -> bool:
+        return model.startswith("openai/")
+
+    async def create_batch(self, requests: list[dict]) -> str:
+        """Upload requests as JSONL and start a batch job. Returns the batch id."""
+        session = await get_session()
+
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        form.add_field(
+            "file",
+            b"\n".join(orjson.dumps(r) for r in requests),
+            filename="batch.jsonl",
+            content_type="application/jsonl",
+        )
+        async with session.post(
+            f"{OPENAI_API_BASE}/files", headers=self.headers, data=form, timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            input_file_id = orjson.loads(await response.read())["id"]
+
+        payload = {
+            "input_file_id": input_file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        }
+        async with session.post(
+            f"{OPENAI_API_BASE}/batches", headers=self.headers, json=payload, timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            return orjson.loads(await response.read())["id"]
+
+    async def poll_batch(self, batch_id: str) -> dict:
+        """Wait for a batch job to reach a terminal state and return it."""
+        session = await get_session()
+        while True:
+            async with session.get(
+                f"{OPENAI_API_BASE}/batches/{batch_id}", headers=self.headers, timeout=self.timeout
+            ) as response:
+                response.raise_for_status()
+                batch = orjson.loads(await response.read())
+            if batch["status"] in ("completed", "failed", "expired", "cancelled"):
+                return batch
+            await asyncio.sleep(BATCH_POLL_SECONDS)
+
+    async def fetch_results(self, output_file_id: str) -> dict[str, tuple[str, int | None]]:
+        """Download a batch's output file. Returns (content, total_tokens) keyed by custom_id.
+
+        The file is parsed line by line as it streams in and only those two
+        fields are kept, so memory doesn't grow with the full response bodies.
+        """
+        session = await get_session()
+        outputs = {}
+        async with session.get(
+            f"{OPENAI_API_BASE}/files/{output_file_id}/content",
+            headers=self.headers,
+            timeout=self.timeout,
+        ) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                item = orjson.loads(line)
+                if item.get("error") or item["response"]["status_code"] != 200:
+                    continue
+                body = item["response"]["body"]
+                outputs[item["custom_id"]] = (
+                    body["choices"][0]["message"]["content"],
+                    body.get("usage", {}).get("total_tokens"),
+                )
+        return outputs
+
+    async def synthesize(self, model: str, prompts: dict[str, str], temperature: float = 0.3) -> dict[str, dict]:
+        """Run one batch job for a model. Returns results keyed by test case id.
+
+        Results use OpenRouterClient.generate_async's shape; cases missing from
+        the output (per-request errors) are left out so callers can fall back.
+        """
+        requests = [
+            {
+                "custom_id": f"{case_id}|{model}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model.split("/", 1)[1],
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": temperature,
+                },
+            }
+            for case_id, prompt in prompts.items()
+        ]
+
+        batch_id = await self.create_batch(requests)
+        print(f"  Submitted batch {batch_id} for {model} ({len(requests)} requests)")
+        batch = await self.poll_batch(batch_id)
+        if batch["status"] != "completed" or not batch.get("output_file_id"):
+            raise RuntimeError(f"Batch {batch_id} for {model} ended with status {batch['status']}")
+
+        results = {}
+        for custom_id, (content, tokens) in (await self.fetch_results(batch["output_file_id"])).items():
+            case_id = custom_id.split("|", 1)[0]
+            results[case_id] = {
+                "content": content,
+                "time_seconds": None,
+                "ttft_seconds": None,
+                "cost": None,
+                "tokens": tokens,
+            }
+        return results
+
 
 # -----------------------------------------------------------------------------
 # DeepEval Judge Model
 # -----------------------------------------------------------------------------
 
-class OpenRouterJudge(DeepEvalBaseLLM):
+# GEval prompts put the metric's instructions and the test case Input ahead of
+# the Actual Output, so everything before this marker is identical for every
+# model's synthesis of the same case and can be served from the provider's
+# prompt cache
+JUDGE_PREFIX_END = "\nActual Output:\n"
+
+# OpenRouter providers that need explicit cache_control breakpoints; others
+# (e.g. OpenAI) cache long shared prefixes automatically
+CACHE_CONTROL_PREFIXES = ("anthropic/", "google/")
+
+
+class OpenRouterJudge(SyncRunnerMixin, DeepEvalBaseLLM):
     """DeepEval judge model using OpenRouter."""
 
-    def __init__(self, model: str, api_key: str):
+    request_timeout = 120.0
+
+    def __init__(
+        self,
+        model: str,
+        api_key: str,
+        cache: JudgeCache | None = None,
+        use_json_schema: bool = False,
+    ):
         self.model_name = model
+        self.max_concurrency = MAX_CONCURRENCY.get(model, DEFAULT_MAX_CONCURRENCY)
         self.api_key = api_key
-
-    def load_model(self):
-        return self.model_name
-
-    def generate(self, prompt: str, schema=None) -> str:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "HTTP-Referer": "https://markm8.com",
             "X-Title": "MarkM8 Evals",
         }
-        payload = {
-            "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.1,
-        }
-        if schema:
-            payload["response_format"] = {"type": "json_schema", "json_schema": schema}
+        # None disables the verdict cache
+        self.cache = JudgeModelCache(cache, model)
+        # GEval's prompts already ask for JSON and DeepEval parses the text, so
+        # provider-side schema enforcement (extra latency) is opt-in
+        self.use_json_schema = use_json_schema
+        self._inflight: dict[str, asyncio.Task] = {}
+        # One limiter per loop, as the sync path runs on the background loop
+        self._limiters = LoopLimiters(self.max_concurrency)
+        self.prompt_caching = model.startswith(CACHE_CONTROL_PREFIXES)
+        # Fields shared by every judge call; a_generate only adds messages/schema
+        self._base_payload = {"model": model, "temperature": 0.1, "stream": True}
 
-        with httpx.Client(timeout=120.0) as client:
-            response = client.post(OPENROUTER_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+    def load_model(self):
+        return self.model_name
+
+    def generate(self, prompt: str, schema=None) -> str:
+        return self._run_sync(self.a_generate(prompt, schema))
 
     async def a_generate(self, prompt: str, schema=None) -> str:
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://markm8.com",
-            "X-Title": "MarkM8 Evals",
-        }
+        key = self.cache.key(prompt)
+        cached = self.cache.get(key, schema)
+        if cached is not None:
+            return cached
+
+        # Concurrent identical prompts share one in-flight request. The
+        # check-and-insert has no await in between, so no lock is needed.
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._request(prompt, schema, key))
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._forget_inflight, key))
+        return await asyncio.shield(task)
+
+    def _forget_inflight(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _request(self, prompt: str, schema, key: str) -> str:
         payload = {
-            "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.1,
+            **self._base_payload,
+            "messages": [{"role": "user", "content": self._message_content(prompt)}],
         }
-        if schema:
-            payload["response_format"] = {"type": "json_schema", "json_schema": schema}
-
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(OPENROUTER_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+        if schema is not None and self.use_json_schema:
+            payload["response_format"] = json_schema_format(schema)
+
+        label = f"judge {self.model_name}"
+        limiter = self.limiter()
+        async with limiter, post_with_retry(
+            OPENROUTER_API_URL,
+            label=label,
+            limiter=limiter,
+            headers=self.headers,
+            json=payload,
+            timeout=self.timeout,
+        ) as response:
+            content = await read_judge_content(response, label=label)
+
+        self.cache.put(key, content, schema)
+        return content
+
+    def limiter(self) -> AdaptiveSemaphore:
+        """Return the adaptive concurrency limit for the running loop."""
+        return self._limiters.get()
+
+    def _message_content(self, prompt: str) -> str | list[dict]:
+        """Mark the shared judge prompt prefix as cacheable where the provider needs it.
+
+        The text sent is unchanged; it is only split into two parts with a
+        cache breakpoint after the Input.
+        """
+        split = prompt.find(JUDGE_PREFIX_END) if self.prompt_caching else -1
+        if split <= 0:
+            return prompt
+        return [
+            {"type": "text", "text": prompt[:split], "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": prompt[split:]},
+        ]
 
     def get_model_name(self) -> str:
         return self.model_name
@@ -567,7 +655,312 @@ def create_metrics(judge: DeepEvalBaseLLM) -> list[GEval]:
 # Main Benchmark
 # -----------------------------------------------------------------------------
 
-def run_benchmark():
+PERCENTILES = (50, 90, 99)
+
+
+# Per-(model, case) stats tracked for the summary and results JSON
+RUN_STATS = ("times", "ttfts", "costs", "selection", "quality")
+
+
+def _nanmean_rows(values: np.ndarray) -> np.ndarray:
+    """Per-row mean ignoring NaN; rows with no values average to 0."""
+    counts = np.count_nonzero(~np.isnan(values), axis=1)
+    sums = np.nansum(values, axis=1, dtype=np.float64)
+    return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+
+def latency_percentiles(samples: np.ndarray, starts: np.ndarray) -> dict[str, float] | None:
+    """p50/p90/p99 of timed samples (NaN = untimed), in seconds.
+
+    The sample whose call started first (smallest perf_counter_ns in
+    `starts`) is treated as warm-up (connection setup, provider cold start)
+    and dropped, unless it is the only one. Calls run in parallel, so this is
+    not necessarily the first sample in case order.
+    """
+    timed = ~np.isnan(samples)
+    timed_starts = np.where(timed, starts, np.nan)
+    if np.count_nonzero(timed) > 1 and not np.isnan(timed_starts).all():
+        timed[np.nanargmin(timed_starts)] = False
+    if not timed.any():
+        return None
+    values = np.percentile(samples[timed].astype(np.float64), PERCENTILES)
+    return {f"p{p}": float(v) for p, v in zip(PERCENTILES, values)}
+
+
+def _measure(metric: GEval, test: LLMTestCase):
+    """Awaitable that scores `test` with `metric` without blocking the loop.
+
+    DeepEval releases without a_measure only have the blocking measure(),
+    which then runs in a worker thread.
+    """
+    if hasattr(metric, "a_measure"):
+        return metric.a_measure(test, _show_indicator=False)
+    return asyncio.to_thread(metric.measure, test, _show_indicator=False)
+
+
+async def _judge_one(metric_prototypes: list[GEval], grader_xml: str, result: dict) -> dict:
+    """Score one synthesis result with the judge and return its benchmark record."""
+    # GEval keeps its score on the instance, so each task scores on its own
+    # shallow copy; the steps, params and judge are shared
+    metrics = [copy.copy(metric) for metric in metric_prototypes]
+    test = LLMTestCase(input=grader_xml, actual_output=result["content"])
+    # Metrics are independent, so their judge calls can overlap
+    await asyncio.gather(*(_measure(metric, test) for metric in metrics))
+
+    return {
+        "time_seconds": result["time_seconds"],
+        "ttft_seconds": result.get("ttft_seconds"),
+        "start_ns": result.get("start_ns"),
+        "elapsed_ns": result.get("elapsed_ns"),
+        "ttft_ns": result.get("ttft_ns"),
+        "cost": result["cost"] or 0,
+        "tokens": result.get("tokens"),
+        "cached": result.get("cached", False),
+        "selection": metrics[0].score,
+        "quality": metrics[1].score,
+        "content": result["content"],
+    }
+
+
+def checkpoint_fingerprints(prompts: dict[str, str], judge: DeepEvalBaseLLM) -> dict[str, str]:
+    """Fingerprint per case id of everything a checkpointed record depends on.
+
+    Covers the synthesis prompt (which embeds the test case), the judge
+    model and the metrics' evaluation steps, so a resumed run never mixes in
+    records scored under different ones.
+    """
+    judging = orjson.dumps(
+        [judge.get_model_name(), [metric.evaluation_steps for metric in create_metrics(judge)]]
+    )
+    return {
+        case_id: hashlib.sha256(prompt.encode() + b"\0" + judging).hexdigest()
+        for case_id, prompt in prompts.items()
+    }
+
+
+def load_checkpoint(path: Path, fingerprints: dict[str, str]) -> dict[tuple[str, str], dict]:
+    """Records from an interrupted run's checkpoint, keyed by (model, case id).
+
+    Records whose fingerprint doesn't match `fingerprints` (see
+    checkpoint_fingerprints) are skipped and get scored again.
+    """
+    if not path.exists():
+        return {}
+    completed = {}
+    stale = 0
+    with path.open("rb") as f:
+        for line in f:
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # line torn by a crash mid-write
+            if entry.get("fingerprint") != fingerprints.get(entry["case_id"]):
+                stale += 1
+                continue
+            completed[(entry["model"], entry["case_id"])] = entry["record"]
+    if stale:
+        print(f"Ignoring {stale} checkpointed pairs scored with a different prompt, judge or metrics")
+    return completed
+
+
+async def _run_pipeline(
+    client: OpenRouterClient,
+    judge: DeepEvalBaseLLM,
+    pairs: list[tuple[str, dict]],
+    grader_xmls: dict[str, str],
+    prompts: dict[str, str],
+    synthesized: dict[tuple[str, str], dict],
+    completed: dict[tuple[str, str], dict],
+    checkpoint,
+    fingerprints: dict[str, str],
+) -> list:
+    """Synthesize and judge every pair, with the two stages joined by a queue.
+
+    Synthesis workers (the per-model queues, capped by CONCURRENCY) hand each
+    finished synthesis to JUDGE_WORKERS judge consumers, so judging starts as
+    soon as any synthesis lands and neither stage holds the other's slots.
+    Pairs with a precomputed synthesis (e.g. from a batch job) skip the
+    generation call, and pairs in `completed` skip both stages and are
+    flagged resumed. Each new record is appended to the `checkpoint` file,
+    with its case's fingerprint, as it lands. Returns records or exceptions
+    in `pairs` order.
+    """
+    sem = asyncio.Semaphore(CONCURRENCY)
+    metric_prototypes = create_metrics(judge)
+    judge_queue: asyncio.Queue = asyncio.Queue(maxsize=JUDGE_QUEUE_SIZE)
+    scores: dict[tuple[str, str], dict | Exception] = {}
+
+    async def synthesize(model: str, test_case: dict) -> dict:
+        record = completed.get((model, test_case["id"]))
+        if record is not None:
+            record = scores[(model, test_case["id"])] = {**record, "resumed": True}
+            return record
+        result = synthesized.get((model, test_case["id"]))
+        if result is None:
+            async with sem:
+                result = await client.generate_async(model, prompts[test_case["id"]])
+        await judge_queue.put((model, test_case["id"], result))
+        return result
+
+    async def judge_worker():
+        # A None item means synthesis is finished
+        while (item := await judge_queue.get()) is not None:
+            model, case_id, result = item
+            # Any failure is recorded against the pair rather than ending the
+            # worker; with every worker gone the bounded queue would fill and
+            # block the producers forever
+            try:
+                record = await _judge_one(metric_prototypes, grader_xmls[case_id], result)
+                # One unbuffered write per line, so a crash loses at most this record
+                line = orjson.dumps({
+                    "model": model,
+                    "case_id": case_id,
+                    "fingerprint": fingerprints[case_id],
+                    "record": record,
+                }) + b"\n"
+                await asyncio.to_thread(checkpoint.write, line)
+            except Exception as e:
+                scores[(model, case_id)] = e
+                continue
+            scores[(model, case_id)] = record
+
+    consumers = [asyncio.create_task(judge_worker()) for _ in range(JUDGE_WORKERS)]
+    try:
+        synthesis_outcomes = await _run_model_queues(pairs, synthesize)
+        for _ in consumers:
+            await judge_queue.put(None)
+        await asyncio.gather(*consumers)
+    finally:
+        for task in consumers:
+            task.cancel()
+
+    # A failed synthesis never reached the judge, so report its own error
+    return [
+        outcome if isinstance(outcome, Exception) else scores[(model, test_case["id"])]
+        for (model, test_case), outcome in zip(pairs, synthesis_outcomes)
+    ]
+
+
+RUN_TABLE_SCHEMA = pa.schema([
+    ("model", pa.string()),
+    ("case_id", pa.string()),
+    ("elapsed_ns", pa.int64()),
+    ("ttft_ns", pa.int64()),
+    ("cost", pa.float64()),
+    ("tokens", pa.int64()),
+    ("cached", pa.bool_()),
+    ("selection", pa.float64()),
+    ("quality", pa.float64()),
+    ("content_len", pa.int64()),
+    ("error", pa.string()),
+])
+
+
+def write_run_table(
+    pairs: list[tuple[str, dict]],
+    outcomes: list,
+    table_file: Path,
+    contents_file: Path,
+):
+    """Write one row per (model, test case) as a columnar Parquet table.
+
+    Synthesis text is kept out of the table and written to `contents_file`
+    as JSONL keyed by the row's index. Timings are null for calls that
+    weren't timed this run (cache hits, resumed pairs, batch results, errors).
+    """
+    columns = {name: [] for name in RUN_TABLE_SCHEMA.names}
+    content_lines = []
+    for row, ((model, test_case), outcome) in enumerate(zip(pairs, outcomes)):
+        failed = isinstance(outcome, Exception)
+        record = {} if failed else outcome
+        timed = not failed and not record["cached"] and not record.get("resumed")
+        columns["model"].append(model)
+        columns["case_id"].append(test_case["id"])
+        columns["elapsed_ns"].append(record.get("elapsed_ns") if timed else None)
+        columns["ttft_ns"].append(record.get("ttft_ns") if timed else None)
+        columns["cost"].append(record.get("cost"))
+        columns["tokens"].append(record.get("tokens"))
+        columns["cached"].append(record.get("cached"))
+        columns["selection"].append(record.get("selection"))
+        columns["quality"].append(record.get("quality"))
+        columns["content_len"].append(None if failed else len(record["content"]))
+        columns["error"].append(str(outcome) if failed else None)
+        if not failed:
+            content_lines.append(orjson.dumps(
+                {"row": row, "model": model, "case_id": test_case["id"], "content": record["content"]}
+            ))
+
+    pq.write_table(pa.Table.from_pydict(columns, schema=RUN_TABLE_SCHEMA), table_file)
+    contents_file.write_bytes(b"\n".join(content_lines) + b"\n" if content_lines else b"")
+
+
+async def _run_model_queues(
+    pairs: list[tuple[str, dict]],
+    run_pair,
+) -> list:
+    """Run `run_pair(model, test_case)` for every pair through per-model queues.
+
+    Each model gets its own queue drained by N_WORKERS workers, so a model's
+    test cases are sent together rather than interleaved with other models.
+    Returns outcomes (results or exceptions) in `pairs` order.
+    """
+    outcomes: list = [None] * len(pairs)
+    queues: dict[str, asyncio.Queue] = {}
+    for index, (model, test_case) in enumerate(pairs):
+        queues.setdefault(model, asyncio.Queue()).put_nowait((index, test_case))
+
+    async def worker(model: str, queue: asyncio.Queue):
+        while True:
+            index, test_case = await queue.get()
+            try:
+                outcomes[index] = await run_pair(model, test_case)
+            except Exception as e:
+                outcomes[index] = e
+            finally:
+                queue.task_done()
+
+    workers = [
+        asyncio.create_task(worker(model, queue))
+        for model, queue in queues.items()
+        for _ in range(min(N_WORKERS, queue.qsize()))
+    ]
+    try:
+        await asyncio.gather(*(queue.join() for queue in queues.values()))
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return outcomes
+
+
+async def _run_batches(models: list[str], prompts: dict[str, str]) -> dict[tuple[str, str], dict]:
+    """Synthesize every prompt (keyed by case id) for `models`, one batch job per model.
+
+    Returns results keyed by (model, case id). A failed job is reported and
+    skipped, leaving its pairs to the regular async path.
+    """
+    batch_client = OpenAIBatchClient(os.environ["OPENAI_API_KEY"])
+    outcomes = await asyncio.gather(
+        *(batch_client.synthesize(model, prompts) for model in models),
+        return_exceptions=True,
+    )
+
+    synthesized = {}
+    for model, outcome in zip(models, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"  Batch for {model} failed ({outcome}) - falling back to async calls")
+            continue
+        for case_id, result in outcome.items():
+            synthesized[(model, case_id)] = result
+    return synthesized
+
+
+async def run_benchmark(
+    batch: bool = False,
+    use_cache: bool = True,
+    refresh_models: frozenset[str] = frozenset(),
+    resume: bool = True,
+):
     """Run the synthesis benchmark across all models and test cases."""
 
     api_key = os.environ.get("OPENROUTER_API_KEY")
@@ -575,106 +968,194 @@ def run_benchmark():
         print("Error: OPENROUTER_API_KEY required", file=sys.stderr)
         sys.exit(1)
 
-    client = OpenRouterClient(api_key)
-    judge = OpenRouterJudge(JUDGE_MODEL, api_key)
-    metrics = create_metrics(judge)
+    client = OpenRouterClient(
+        api_key,
+        cache_dir=CACHE_DIR if use_cache else None,
+        refresh_models=refresh_models,
+    )
+    judge_cache = JudgeCache() if use_cache else None
+    judge = OpenRouterJudge(JUDGE_MODEL, api_key, cache=judge_cache)
+    cache_desc = f"{CACHE_DIR}, {judge_cache.path}" if judge_cache else "disabled"
 
     print("=" * 70)
     print("SYNTHESIS MODEL BENCHMARK")
     print("=" * 70)
     print(f"Test cases: {len(TEST_CASES)}")
     print(f"Models: {', '.join(SYNTHESIS_MODELS)}")
-    print(f"Judge: {JUDGE_MODEL}")
+    print(f"Judge: {JUDGE_MODEL} (up to {judge.max_concurrency} requests in flight, adaptive)")
+    print(f"Concurrency: {CONCURRENCY} ({N_WORKERS} workers per model, {JUDGE_WORKERS} judge workers)")
+    print(f"Cache: {cache_desc}")
     print("=" * 70)
 
-    # Results storage
-    results = {model: {"times": [], "costs": [], "selection": [], "quality": []}
-               for model in SYNTHESIS_MODELS}
-
+    # Prompts depend only on the test case, so render each once rather than per
+    # model; cases that share identical grader feedback also share its XML
+    xml_by_feedback: dict[bytes, str] = {}
+    grader_xmls = {}
+    prompts = {}
     for test_case in TEST_CASES:
-        print(f"\n--- Test Case: {test_case['essay_title'][:50]}... ---")
-
-        # Build synthesis prompt
-        grader_xml = format_grader_feedback_xml(test_case["grader_feedback"])
-        prompt = SYNTHESIS_PROMPT_TEMPLATE.format(
-            num_graders=len(test_case["grader_feedback"]),
-            essay_title=test_case["essay_title"],
-            rubric=test_case["rubric"],
-            essay_content=test_case["essay_content"],
-            grader_feedback_xml=grader_xml,
+        feedback_key = orjson.dumps(test_case["grader_feedback"])
+        if feedback_key not in xml_by_feedback:
+            xml_by_feedback[feedback_key] = format_grader_feedback_xml(test_case["grader_feedback"])
+        grader_xmls[test_case["id"]] = xml_by_feedback[feedback_key]
+        prompts[test_case["id"]] = build_prompt(test_case, grader_xmls[test_case["id"]])
+
+    pairs = [(model, test_case) for model in SYNTHESIS_MODELS for test_case in TEST_CASES]
+
+    fingerprints = checkpoint_fingerprints(prompts, judge)
+    completed = load_checkpoint(CHECKPOINT_FILE, fingerprints) if resume else {}
+    if completed:
+        print(f"Resuming: {len(completed)} pairs already scored in {CHECKPOINT_FILE} (left out of latency stats)")
+    CHECKPOINT_FILE.parent.mkdir(exist_ok=True)
+
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=EXECUTOR_THREADS))
+    start_time = time.perf_counter()
+    async with client:
+        synthesized = {}
+        if batch:
+            batch_models = [m for m in SYNTHESIS_MODELS if OpenAIBatchClient.supports(m)]
+            if not os.environ.get("OPENAI_API_KEY"):
+                print("Warning: --batch needs OPENAI_API_KEY; using async calls for all models")
+            elif batch_models:
+                synthesized = await _run_batches(batch_models, prompts)
+
+        with CHECKPOINT_FILE.open("ab" if completed else "wb", buffering=0) as checkpoint:
+            outcomes = await _run_pipeline(
+                client, judge, pairs, grader_xmls, prompts, synthesized, completed, checkpoint, fingerprints
+            )
+    wall_time = time.perf_counter() - start_time
+    if judge_cache is not None:
+        judge_cache.close()
+
+    # One (model, case) array per stat; NaN marks no value (error, or a cache
+    # hit for the timings)
+    shape = (len(SYNTHESIS_MODELS), len(TEST_CASES))
+    stats = {name: np.full(shape, np.nan, dtype=np.float32) for name in RUN_STATS}
+    # When each timed call started (perf_counter_ns), to find a model's warm-up
+    # call; float64 keeps enough precision to order them
+    starts = np.full(shape, np.nan, dtype=np.float64)
+
+    # Report per-pair outcomes only once everything has finished, so output
+    # stays grouped by model instead of interleaving in completion order.
+    # Pairs are model-major, so the pair index maps straight onto the arrays.
+    for index, ((model, test_case), outcome) in enumerate(zip(pairs, outcomes)):
+        model_idx, case_idx = divmod(index, len(TEST_CASES))
+        if isinstance(outcome, Exception):
+            print(f"  {model} / {test_case['id']}: ERROR: {outcome}")
+            continue
+
+        if outcome.get("resumed"):
+            elapsed = "resumed"
+        elif outcome["cached"]:
+            elapsed = "cached"
+        elif outcome["time_seconds"] is None:
+            elapsed = "batched"
+        else:
+            elapsed = f"{outcome['time_seconds']:.1f}s"
+        print(
+            f"  {model} / {test_case['id']}: {elapsed} "
+            f"[Sel:{outcome['selection']:.2f} Qual:{outcome['quality']:.2f}]"
         )
 
-        # Run each synthesis model
-        for model in SYNTHESIS_MODELS:
-            print(f"  Running {model}...", end=" ", flush=True)
-
-            try:
-                # Generate synthesis
-                result = client.generate(model, prompt)
-                synthesis = result["content"]
-
-                print(f"{result['time_seconds']:.1f}s", end=" ", flush=True)
-
-                # Evaluate
-                test = LLMTestCase(
-                    input=grader_xml,
-                    actual_output=synthesis,
-                )
-
-                # Run metrics
-                for metric in metrics:
-                    metric.measure(test)
-
-                selection_score = metrics[0].score
-                quality_score = metrics[1].score
-
-                print(f"[Sel:{selection_score:.2f} Qual:{quality_score:.2f}]")
-
-                # Store results
-                results[model]["times"].append(result["time_seconds"])
-                results[model]["costs"].append(result["cost"] or 0)
-                results[model]["selection"].append(selection_score)
-                results[model]["quality"].append(quality_score)
-
-            except Exception as e:
-                print(f"ERROR: {e}")
-                results[model]["times"].append(None)
-                results[model]["costs"].append(None)
-                results[model]["selection"].append(None)
-                results[model]["quality"].append(None)
+        # Cache hits and resumed pairs weren't timed this run, so keep them
+        # out of latency stats
+        if not outcome["cached"] and not outcome.get("resumed"):
+            stats["times"][model_idx, case_idx] = outcome["time_seconds"] or np.nan
+            stats["ttfts"][model_idx, case_idx] = outcome["ttft_seconds"] or np.nan
+            starts[model_idx, case_idx] = outcome.get("start_ns") or np.nan
+        stats["costs"][model_idx, case_idx] = outcome["cost"]
+        stats["selection"][model_idx, case_idx] = outcome["selection"]
+        stats["quality"][model_idx, case_idx] = outcome["quality"]
+
+    avg_sel = _nanmean_rows(stats["selection"])
+    avg_qual = _nanmean_rows(stats["quality"])
+    avg_time = _nanmean_rows(stats["times"])
+    avg_ttft = _nanmean_rows(stats["ttfts"])
+    total_cost = np.nansum(stats["costs"], axis=1, dtype=np.float64)
 
     # Print summary
-    print("\n" + "=" * 70)
+    print("\n" + "=" * 80)
     print("RESULTS SUMMARY")
-    print("=" * 70)
-    print(f"{'Model':<35} {'Selection':>10} {'Quality':>10} {'Time':>8} {'Cost':>10}")
-    print("-" * 70)
-
-    for model in SYNTHESIS_MODELS:
-        r = results[model]
-
-        # Calculate averages (excluding None values)
-        valid_sel = [s for s in r["selection"] if s is not None]
-        valid_qual = [q for q in r["quality"] if q is not None]
-        valid_times = [t for t in r["times"] if t is not None]
-        valid_costs = [c for c in r["costs"] if c is not None]
-
-        avg_sel = sum(valid_sel) / len(valid_sel) if valid_sel else 0
-        avg_qual = sum(valid_qual) / len(valid_qual) if valid_qual else 0
-        avg_time = sum(valid_times) / len(valid_times) if valid_times else 0
-        total_cost = sum(valid_costs) if valid_costs else 0
+    print("=" * 80)
+    print(f"{'Model':<35} {'Selection':>10} {'Quality':>10} {'TTFT':>8} {'Time':>8} {'Cost':>10}")
+    print("-" * 80)
+
+    for i, model in enumerate(SYNTHESIS_MODELS):
+        print(f"{model:<35} {avg_sel[i]:>10.2f} {avg_qual[i]:>10.2f} {avg_ttft[i]:>7.1f}s "
+              f"{avg_time[i]:>7.1f}s ${total_cost[i]:>8.4f}")
+
+    print("-" * 80)
+    print("Latency percentiles (earliest-started call per model dropped as warm-up)")
+    print(f"{'Model':<35} {'TTFT p50':>10} {'p50':>8} {'p90':>8} {'p99':>8}")
+    print("-" * 80)
+
+    results = {}
+    for i, model in enumerate(SYNTHESIS_MODELS):
+        r = results[model] = {name: stats[name][i] for name in RUN_STATS}
+        r["time_percentiles"] = latency_percentiles(r["times"], starts[i])
+        r["ttft_percentiles"] = latency_percentiles(r["ttfts"], starts[i])
+        if r["time_percentiles"] is None:
+            print(f"{model:<35} {'-':>10} {'-':>8} {'-':>8} {'-':>8}")
+            continue
+        ttft_p50 = f"{r['ttft_percentiles']['p50']:.2f}s" if r["ttft_percentiles"] else "-"
+        p = r["time_percentiles"]
+        print(f"{model:<35} {ttft_p50:>10} {p['p50']:>7.2f}s {p['p90']:>7.2f}s {p['p99']:>7.2f}s")
+
+    print("=" * 80)
+    print(f"Wall time: {wall_time:.1f}s")
+
+    # Save detailed results - file I/O runs in worker threads to keep the loop free
+    output_file = Path(__file__).parent / "results" / "benchmark_results.json"
+    table_file = output_file.with_name("benchmark_runs.parquet")
+    contents_file = output_file.with_name("benchmark_contents.jsonl")
+    await asyncio.gather(
+        asyncio.to_thread(output_file.write_bytes, orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)),
+        asyncio.to_thread(write_run_table, pairs, outcomes, table_file, contents_file),
+    )
+    print(f"\nDetailed results saved to: {output_file}")
+    print(f"Per-call table saved to: {table_file} (synthesis text in {contents_file.name})")
 
-        print(f"{model:<35} {avg_sel:>10.2f} {avg_qual:>10.2f} {avg_time:>7.1f}s ${total_cost:>8.4f}")
+    # Keep the checkpoint while pairs failed, so a rerun only retries those
+    if any(isinstance(outcome, Exception) for outcome in outcomes):
+        print(f"Some pairs failed; rerun to retry them (checkpoint: {CHECKPOINT_FILE})")
+    else:
+        CHECKPOINT_FILE.unlink()
 
-    print("=" * 70)
 
-    # Save detailed results
-    output_file = Path(__file__).parent / "results" / "benchmark_results.json"
-    output_file.parent.mkdir(exist_ok=True)
-    with open(output_file, "w") as f:
-        json.dump(results, f, indent=2)
-    print(f"\nDetailed results saved to: {output_file}")
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark synthesis models")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Synthesize openai/* models through OpenAI's Batch API (cheaper, slower, untimed)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the on-disk synthesis and judge caches",
+    )
+    parser.add_argument(
+        "--refresh-model",
+        action="append",
+        default=[],
+        metavar="MODEL",
+        help="Re-run synthesis for MODEL even if cached (repeatable)",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Start over instead of resuming from an interrupted run's checkpoint",
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        run_benchmark(
+            batch=args.batch,
+            use_cache=not args.no_cache,
+            refresh_models=frozenset(args.refresh_model),
+            resume=not args.no_resume,
+        ),
+        loop_factory=uvloop.new_event_loop if uvloop else None,
+    )
 
 
 if __name__ == "__main__":
-    run_benchmark()
+    main()
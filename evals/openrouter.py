@@ -0,0 +1,457 @@
+"""
+Shared OpenRouter HTTP plumbing for the eval scripts.
+
+One pooled aiohttp session per event loop, a retrying POST helper, a
+background loop that lets sync callers reuse the same session, and an
+on-disk cache of judge responses.
+"""
+
+import asyncio
+import atexit
+import hashlib
+import math
+import random
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import aiohttp
+import orjson
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows; fall back to the stock loop
+    uvloop = None
+
+OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Attempts per OpenRouter request on 429/5xx/connection errors before giving up
+MAX_RETRIES = 6
+
+# Longest server-requested Retry-After wait honoured, in seconds
+MAX_RETRY_AFTER = 60.0
+
+
+# One pooled session per event loop, shared by every client in the process so
+# all calls reuse the same warm keep-alive connections
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Return the shared session for the running loop, opening it if needed."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=64, limit_per_host=32, ttl_dns_cache=300, keepalive_timeout=60
+            ),
+            timeout=aiohttp.ClientTimeout(total=180),
+            json_serialize=lambda obj: orjson.dumps(obj).decode(),
+        )
+        _sessions[loop] = session
+    return session
+
+
+async def close_session():
+    """Close the shared session for the running loop."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+@atexit.register
+def close_idle_sessions():
+    """Close sessions still open on idle loops (e.g. DeepEval's).
+
+    Also runs at exit, so sessions left open by sync callers get closed.
+    """
+    for loop, session in list(_sessions.items()):
+        if not session.closed and not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(session.close())
+
+
+def _retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Seconds to wait before retry `attempt`: Retry-After if given, else capped exponential, plus jitter.
+
+    Retry-After is clamped to [0, MAX_RETRY_AFTER], so a negative, past or
+    huge value can't skip the wait or stall the run; NaN or an unparseable
+    value falls back to exponential backoff.
+    """
+    if retry_after:
+        try:
+            wait = float(retry_after)
+        except ValueError:
+            # HTTP-date form, e.g. "Wed, 21 Oct 2026 07:28:00 GMT"
+            try:
+                wait = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                wait = math.nan
+        if not math.isnan(wait):
+            return min(max(wait, 0.0), MAX_RETRY_AFTER) + random.random()
+    return min(30, 2**attempt) + random.random()
+
+
+# Strong refs to background drains, which asyncio would otherwise let be GC'd
+_pending_drains: set[asyncio.Task] = set()
+
+
+async def _drain_and_release(response: aiohttp.ClientResponse):
+    try:
+        await response.read()
+    except Exception:
+        pass  # a broken stream just means the connection isn't reused
+    finally:
+        response.release()
+
+
+def _release(response: aiohttp.ClientResponse):
+    """Release a response, finishing any unread body in the background first.
+
+    aiohttp drops the connection of a response released mid-body; draining
+    the (usually tiny) remainder lets callers stop reading early and still
+    hand a warm keep-alive connection back to the pool.
+    """
+    if response.content.at_eof():
+        response.release()
+        return
+    task = asyncio.create_task(_drain_and_release(response))
+    _pending_drains.add(task)
+    task.add_done_callback(_pending_drains.discard)
+
+
+class AdaptiveSemaphore:
+    """Concurrency limit that tracks the provider's rate limit (AIMD).
+
+    Starts at `max_permits`; each 429 halves the limit (never below 1) and
+    each success adds `increase` back, up to `max_permits`. Use as
+    `async with sem:` around a request. Bound to the loop it is first used on.
+    """
+
+    def __init__(self, max_permits: int, increase: float = 0.05):
+        self.max_permits = max_permits
+        self.increase = increase
+        self.limit = float(max_permits)
+        self._active = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < int(self.limit))
+            self._active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._cond:
+            self._active -= 1
+            # Wake everyone: the limit may have grown by more than this one slot
+            self._cond.notify_all()
+
+    def on_429(self):
+        self.limit = max(1.0, self.limit / 2)
+
+    def on_success(self):
+        self.limit = min(float(self.max_permits), self.limit + self.increase)
+
+
+class LoopLimiters:
+    """One AdaptiveSemaphore per event loop, created on first use.
+
+    A judge is called both from DeepEval's loop and from the background loop
+    that serves sync callers, and a semaphore only works on one loop.
+    """
+
+    def __init__(self, max_permits: int):
+        self.max_permits = max_permits
+        self._limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AdaptiveSemaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def get(self) -> AdaptiveSemaphore:
+        """Return the limiter for the running loop."""
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = self._limiters[loop] = AdaptiveSemaphore(self.max_permits)
+        return limiter
+
+
+@asynccontextmanager
+async def post_with_retry(url: str, *, label: str, limiter: AdaptiveSemaphore | None = None, **kwargs):
+    """POST via the shared session, retrying rate limits and transient failures.
+
+    429s wait for Retry-After; 5xx and connection errors back off
+    exponentially. Yields the successful response; after MAX_RETRIES attempts
+    the last error is raised with `label` attached as a note. If `limiter` is
+    given, it is told about every 429 and success.
+    """
+    session = await get_session()
+    for attempt in range(MAX_RETRIES):
+        last_attempt = attempt == MAX_RETRIES - 1
+        try:
+            response = await session.post(url, **kwargs)
+        except aiohttp.ClientConnectionError as e:
+            if last_attempt:
+                e.add_note(f"{label}: gave up after {MAX_RETRIES} attempts")
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+
+        if response.status == 429 and limiter is not None:
+            limiter.on_429()
+        if (response.status == 429 or response.status >= 500) and not last_attempt:
+            retry_after = response.headers.get("Retry-After") if response.status == 429 else None
+            response.release()
+            await asyncio.sleep(_retry_delay(attempt, retry_after))
+            continue
+
+        try:
+            try:
+                response.raise_for_status()
+            except aiohttp.ClientResponseError as e:
+                if last_attempt:
+                    e.add_note(f"{label}: gave up after {MAX_RETRIES} attempts")
+                raise
+            if limiter is not None:
+                limiter.on_success()
+            yield response
+        finally:
+            _release(response)
+        return
+
+
+def json_schema_format(schema: type) -> dict:
+    """OpenRouter `response_format` for a DeepEval output schema (a pydantic model class)."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()},
+    }
+
+
+async def iter_sse_chunks(response: aiohttp.ClientResponse, *, label: str):
+    """Yield the parsed chunks of a streamed (stream=true) completion until [DONE].
+
+    SSE frames are "data: {...}" lines; ": ..." keep-alive comments are
+    skipped. A mid-stream error frame raises RuntimeError.
+    """
+    async for line in response.content:
+        if not line.startswith(b"data: "):
+            continue
+        data = line[6:].strip()
+        if data == b"[DONE]":
+            return
+        chunk = orjson.loads(data)
+        if "error" in chunk:
+            raise RuntimeError(f"{label}: stream error: {chunk['error'].get('message')}")
+        yield chunk
+
+
+class JsonObjectEnd:
+    """Incrementally spots where a streamed top-level JSON object closes.
+
+    Only arms if the text starts with "{", so prose or fenced replies are
+    read to the end as usual. Braces inside strings are ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.armed: bool | None = None
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        """Consume the next piece of text; True once the object has closed."""
+        if self.armed is None:
+            stripped = text.lstrip()
+            if not stripped:
+                return False
+            self.armed = stripped[0] == "{"
+        if not self.armed:
+            return False
+
+        for ch in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+async def read_judge_content(response: aiohttp.ClientResponse, *, label: str) -> str:
+    """Return the assistant text of a judge response without buffering the envelope.
+
+    Streamed responses are consumed delta by delta and reading stops as soon
+    as the verdict's JSON object closes, skipping the trailing usage frame.
+    A provider that answers with plain JSON despite stream=true is parsed
+    whole.
+    """
+    if response.content_type != "text/event-stream":
+        data = orjson.loads(await response.read())
+        return data["choices"][0]["message"]["content"]
+
+    parts = []
+    json_end = JsonObjectEnd()
+    async for chunk in iter_sse_chunks(response, label=label):
+        if not chunk.get("choices"):
+            continue
+        delta = chunk["choices"][0].get("delta", {}).get("content")
+        if delta:
+            parts.append(delta)
+            if json_end.feed(delta):
+                break
+    return "".join(parts)
+
+
+# Background loop for sync callers, started on first use. Every thread that
+# calls a sync wrapper shares it (and its one session) instead of running its
+# own loop, so blocking callers can still overlap their requests.
+_sync_loop: asyncio.AbstractEventLoop | None = None
+_sync_loop_lock = threading.Lock()
+
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="sync-http-loop", daemon=True).start()
+    return _sync_loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the background loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_sync_loop()).result()
+
+
+def close_sync_session():
+    """Close the background loop's session, if that loop was ever started."""
+    if _sync_loop is not None and _sync_loop.is_running():
+        asyncio.run_coroutine_threadsafe(close_session(), _sync_loop).result(timeout=10)
+
+
+@atexit.register
+def _stop_sync_loop():
+    """Close the background loop's session and stop the loop at exit."""
+    if _sync_loop is not None and _sync_loop.is_running():
+        close_sync_session()
+        _sync_loop.call_soon_threadsafe(_sync_loop.stop)
+
+
+# -----------------------------------------------------------------------------
+# Judge Cache
+# -----------------------------------------------------------------------------
+
+# Default location of the judge response cache
+JUDGE_CACHE_PATH = Path(__file__).parent / "results" / "judge_cache.sqlite"
+
+
+class JudgeCache:
+    """SQLite cache of judge responses keyed by sha256(model + prompt).
+
+    The judge prompt embeds the metric's steps and the full test case, so an
+    identical prompt to the same model can safely reuse the stored verdict.
+    WAL mode lets concurrent readers proceed while a write is in progress.
+    """
+
+    def __init__(self, path: Path = JUDGE_CACHE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # Lookups are sub-millisecond, so they run inline from any thread or loop
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (h TEXT PRIMARY KEY, response TEXT, ts INTEGER)"
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256((model + prompt).encode()).hexdigest()
+
+    def get(self, key: str, since: int = 0) -> str | None:
+        """Stored response for `key`, ignoring any written before `since` (epoch seconds)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM cache WHERE h = ? AND ts >= ?", (key, since)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (h, response, ts) VALUES (?, ?, ?)",
+                (key, response, int(time.time())),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE h = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def is_valid_verdict(response: str, schema: type | None = None) -> bool:
+    """Whether DeepEval can use a judge reply: a JSON object, matching `schema` if given."""
+    # Only DeepEval judge wrappers get here, so DeepEval is already imported
+    from deepeval.metrics.utils import trimAndLoadJson
+
+    try:
+        data = trimAndLoadJson(response)
+        if schema is not None:
+            schema.model_validate(data)
+    except Exception:
+        return False
+    return isinstance(data, dict)
+
+
+class JudgeModelCache:
+    """One judge model's view of a JudgeCache: the key, lookup and store steps.
+
+    `cache` None disables caching. With `reuse` False responses are only
+    stored, never served, and only responses stored at or after `since`
+    (epoch seconds) are served. Replies DeepEval couldn't parse (see
+    is_valid_verdict) are never stored, and any already stored are evicted
+    on lookup, so the judge is asked again rather than replaying them.
+    """
+
+    def __init__(self, cache: JudgeCache | None, model: str, reuse: bool = True, since: int = 0):
+        self.cache = cache
+        self.model = model
+        self.reuse = reuse
+        self.since = since
+
+    def key(self, prompt: str) -> str:
+        return JudgeCache.key(self.model, prompt)
+
+    def get(self, key: str, schema: type | None = None) -> str | None:
+        if self.cache is None or not self.reuse:
+            return None
+        response = self.cache.get(key, since=self.since)
+        if response is not None and not is_valid_verdict(response, schema):
+            self.cache.delete(key)
+            return None
+        return response
+
+    def put(self, key: str, response: str, schema: type | None = None):
+        if self.cache is not None and is_valid_verdict(response, schema):
+            self.cache.put(key, response)
@@ -11,6 +11,19 @@ Requires:
 
 Optional:
     JUDGE_MODEL - OpenRouter model ID (default: anthropic/claude-opus-4.5)
+    JUDGE_CACHE=1 - Reuse judge responses across runs (results/judge_cache.sqlite);
+        only new or changed test cases (or edited metrics) reach the judge.
+        Responses are always recorded there, so a run that is interrupted
+        resumes on the next run from the responses it recorded, even without
+        JUDGE_CACHE=1.
+    OPENROUTER_PROVIDER_SORT - Provider routing for judge calls: throughput
+        (default), latency or price; empty leaves routing to OpenRouter
+    OPENROUTER_MAX_CONCURRENT - Max async judge requests in flight (default: 16);
+        halved on each 429 and recovered gradually
+    COMBINED_JUDGE=1 - Score all metrics in one judge call per test case
+        instead of one GEval call per metric
+    JUDGE_BATCH_SIZE - With COMBINED_JUDGE=1, score up to this many test cases
+        per judge call (default: 1); worthwhile for small suites of short cases
 
 Recommended judge models (in order of preference):
     - anthropic/claude-opus-4.5
@@ -18,203 +31,88 @@ Recommended judge models (in order of preference):
     - openai/gpt-5.2
 """
 
-import json
 import os
+import re
+import time
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING
 
-import httpx
+import aiohttp
+import orjson
 from dotenv import load_dotenv
 
-# Load .env file from evals directory
-load_dotenv(Path(__file__).parent / ".env")
+from openrouter import JudgeCache, close_idle_sessions
 
-# Disable telemetry before importing deepeval
-os.environ["DEEPEVAL_TELEMETRY"] = "false"
+if TYPE_CHECKING:
+    from deepeval.test_case import LLMTestCase
 
-from deepeval import evaluate
-from deepeval.metrics import GEval
-from deepeval.models import DeepEvalBaseLLM
-from deepeval.test_case import LLMTestCase, LLMTestCaseParams
+# Load .env file from evals directory
+load_dotenv(Path(__file__).parent / ".env")
 
-# Default judge model - best models for evaluation
-DEFAULT_JUDGE_MODEL = "anthropic/claude-opus-4.5"
+# Max (test case, metric) evaluations DeepEval keeps in flight
+MAX_CONCURRENT = 32
 
-# OpenRouter API endpoint
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Holds the start time of the run in progress; left behind by a run that
+# didn't finish
+RUN_MARKER = Path(__file__).parent / "results" / "synthesis_eval.running"
 
 
 # -----------------------------------------------------------------------------
-# OpenRouter Model Wrapper
+# Test Data
 # -----------------------------------------------------------------------------
 
 
-class OpenRouterModel(DeepEvalBaseLLM):
-    """Custom DeepEval model wrapper for OpenRouter API."""
-
-    def __init__(
-        self,
-        model: str = DEFAULT_JUDGE_MODEL,
-        api_key: Optional[str] = None,
-    ):
-        self.model_name = model
-        self.api_key = api_key or os.environ.get("OPENROUTER_API_KEY")
-        if not self.api_key:
-            raise ValueError(
-                "OPENROUTER_API_KEY environment variable is required. "
-                "Set it with: export OPENROUTER_API_KEY=sk-or-..."
-            )
-
-    def load_model(self):
-        """Return the model identifier."""
-        return self.model_name
-
-    def generate(self, prompt: str, schema: Optional[dict] = None) -> str:
-        """Synchronous generation via OpenRouter API."""
-        # Debug: log the prompt being sent
-        if os.environ.get("DEBUG_PROMPTS"):
-            print("\n" + "=" * 80)
-            print("PROMPT SENT TO JUDGE MODEL:")
-            print("=" * 80)
-            print(prompt)
-            print("=" * 80 + "\n")
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://markm8.com",
-            "X-Title": "MarkM8 Evals",
-        }
-
-        payload = {
-            "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.1,  # Low temperature for consistent evaluation
-        }
-
-        # Add JSON schema if provided (for structured output)
-        if schema:
-            payload["response_format"] = {
-                "type": "json_schema",
-                "json_schema": schema,
-            }
-
-        with httpx.Client(timeout=120.0) as client:
-            response = client.post(OPENROUTER_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
-
-    async def a_generate(self, prompt: str, schema: Optional[dict] = None) -> str:
-        """Asynchronous generation via OpenRouter API."""
-        # Debug: log the prompt being sent
-        if os.environ.get("DEBUG_PROMPTS"):
-            print("\n" + "=" * 80)
-            print("PROMPT SENT TO JUDGE MODEL:")
-            print("=" * 80)
-            print(prompt)
-            print("=" * 80 + "\n")
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://markm8.com",
-            "X-Title": "MarkM8 Evals",
-        }
-
-        payload = {
-            "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.1,
-        }
-
-        if schema:
-            payload["response_format"] = {
-                "type": "json_schema",
-                "json_schema": schema,
-            }
-
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                OPENROUTER_API_URL, headers=headers, json=payload
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
-
-    def get_model_name(self) -> str:
-        """Return the model identifier."""
-        return self.model_name
+# Sample grader feedback and synthesis, used when there is no data file
+SAMPLE_CASE_FILE = Path(__file__).parent / "data" / "sample_synthesis.json"
 
+GRADER_BLOCK_RE = re.compile(r"<grader_(\d+)([^>]*)>(.*?)</grader_\1>", re.S)
+GRADER_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
 
-# -----------------------------------------------------------------------------
-# Evaluation Metrics
-# -----------------------------------------------------------------------------
 
+def _feedback_lines(text: str) -> list[str]:
+    return [line.strip().removeprefix("- ") for line in text.splitlines() if line.strip()]
 
-def create_metrics(model: DeepEvalBaseLLM) -> list[GEval]:
-    """
-    Create evaluation metrics using the provided judge model.
 
-    Context: The synthesis takes feedback from multiple graders and distills it
-    into a FIXED number of points. This means some feedback will be dropped.
-    The goal is to keep the MOST relevant, impactful, and helpful feedback.
+def preprocess_feedback(feedback: str) -> str:
+    """Condense <grader_N ...> feedback blocks into compact JSON for the judge.
 
-    Two metrics:
-    1. Selection - Did it pick the RIGHT points to include?
-    2. Quality - Is the output well-written and actionable?
+    Each grader becomes {"grader", <tag attributes>, "strengths",
+    "improvements"}, dropping the markup and indentation that every metric's
+    judge call would otherwise resend. Block bodies are either the grader's
+    feedback JSON (as the synthesis prompt embeds it) or "Strengths:" /
+    "Improvements:" text. Feedback without grader blocks is returned unchanged.
     """
-
-    selection_metric = GEval(
-        name="Selection",
-        evaluation_steps=[
-            "Identify all feedback points from each grader in the Input (strengths and improvements)",
-            "Rank these points by potential impact on student learning and essay quality",
-            "Check which points were included in the Actual Output",
-            "Assess whether the highest-impact points were kept and lower-value points dropped",
-            "Check if the selected points are grounded in specific evidence from the graders (not generic)",
-            "Score 0-10: 0-3=kept trivial points or dropped important ones; 4-6=reasonable selection; 7-10=excellent selection of highest-impact, well-evidenced feedback",
-        ],
-        evaluation_params=[LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT],
-        threshold=0.6,
-        model=model,
-    )
-
-    quality_metric = GEval(
-        name="Quality",
-        evaluation_steps=[
-            "Read each point in the Actual Output from a student's perspective",
-            "Check if each point is clear, concise, and easy to understand",
-            "Check if suggestions are specific and actionable (not vague platitudes)",
-            "Check if feedback explains WHY something matters, not just WHAT to fix",
-            "Check for redundancy: are any two points saying essentially the same thing?",
-            "Score 0-10: 0-3=confusing, vague, or redundant; 4-6=decent but could be clearer; 7-10=crystal clear, actionable, no redundancy",
-        ],
-        evaluation_params=[LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT],
-        threshold=0.6,
-        model=model,
-    )
-
-    return [
-        selection_metric,
-        quality_metric,
-    ]
-
-
-# -----------------------------------------------------------------------------
-# Test Data
-# -----------------------------------------------------------------------------
-
-
-def load_test_cases_from_file(filepath: str) -> list[LLMTestCase]:
+    graders = []
+    for number, attrs, body in GRADER_BLOCK_RE.findall(feedback):
+        grader = {"grader": int(number), **dict(GRADER_ATTR_RE.findall(attrs))}
+        try:
+            parsed = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, dict):
+            grader.update(parsed)
+        elif parsed is not None:
+            grader["feedback"] = parsed
+        elif "Strengths:" in body or "Improvements:" in body:
+            strengths, _, improvements = body.partition("Improvements:")
+            grader["strengths"] = _feedback_lines(strengths.replace("Strengths:", "", 1))
+            grader["improvements"] = _feedback_lines(improvements)
+        else:
+            grader["feedback"] = _feedback_lines(body)
+        graders.append(grader)
+    return orjson.dumps(graders).decode() if graders else feedback
+
+
+def load_test_cases_from_file(filepath: str) -> list["LLMTestCase"]:
     """Load test cases from a JSON file exported from the synthesis experiment."""
-    with open(filepath) as f:
-        data = json.load(f)
+    from deepeval.test_case import LLMTestCase
+
+    data = orjson.loads(Path(filepath).read_bytes())
 
     test_cases = []
     for item in data:
         test_case = LLMTestCase(
-            input=item["original_feedback"],  # The 3 grader outputs
+            input=preprocess_feedback(item["original_feedback"]),  # The 3 grader outputs
             actual_output=item["synthesized_feedback"],  # Model's synthesis
             context=[item.get("essay_content", "")],  # Optional: essay for reference
         )
@@ -223,71 +121,18 @@ def load_test_cases_from_file(filepath: str) -> list[LLMTestCase]:
     return test_cases
 
 
-def create_sample_test_case() -> LLMTestCase:
-    """Create a sample test case for demonstration."""
-
-    # Sample grader feedback (input to synthesis)
-    original_feedback = """
-    <grader_1 model="grok-4" percentage="72">
-    Strengths:
-    - Clear thesis statement: "The essay opens with a well-defined thesis that guides the reader."
-    - Good use of historical evidence with multiple primary sources cited.
-
-    Improvements:
-    - Paragraph transitions need work. Add transitional phrases like "Furthermore" or "In contrast".
-    - Conclusion is weak - merely restates thesis without synthesis.
-    </grader_1>
-
-    <grader_2 model="gemini-3" percentage="68">
-    Strengths:
-    - Strong opening paragraph that hooks the reader.
-    - Effective use of quotations from historians.
-    - Logical argument structure.
-
-    Improvements:
-    - Missing counterarguments - essay does not address opposing viewpoints.
-    - Some claims lack evidence in paragraph 4.
-    </grader_2>
-
-    <grader_3 model="gpt-5" percentage="75">
-    Strengths:
-    - Excellent thesis that is specific and arguable.
-    - Good paragraph structure with clear topic sentences.
-
-    Improvements:
-    - Transitions between sections are abrupt, especially from economic to social analysis.
-    - Conclusion could be stronger - feels rushed.
-    - Citation formatting is inconsistent (MLA vs APA).
-    </grader_3>
-    """
-
-    # Sample synthesized feedback (output to evaluate)
-    # Constrained to 3-4 items per category as per synthesis prompt
-    synthesized_feedback = """
-    ## Strengths (3-4 most impactful)
-
-    1. **Clear and Arguable Thesis**: Your essay opens with a well-defined, specific thesis that effectively guides the reader. As grader 3 noted: "This essay argues that technological innovation, rather than political reform, drove social change" - this is specific and arguable.
-
-    2. **Effective Use of Evidence**: You demonstrate strong use of historical evidence, including quotations from historians and primary sources. The vivid description of factory conditions effectively draws readers in.
-
-    3. **Logical Structure**: The essay follows a logical argument structure with clear topic sentences in each paragraph, building points coherently.
-
-    ## Areas for Improvement (3-4 most actionable)
-
-    1. **Strengthen Transitions**: The transitions between sections need work, particularly the shift from economic to social analysis. Add a bridging paragraph or transitional phrases like "Furthermore," "In contrast," or "Building on this economic foundation."
-
-    2. **Develop the Conclusion**: Your conclusion restates the thesis without synthesis and feels rushed. Expand it to discuss broader implications - why does this matter today?
-
-    3. **Address Counterarguments**: The essay does not address opposing viewpoints. Include a paragraph acknowledging and refuting alternative perspectives to strengthen your argument.
-
-    ## Language Tips
+def create_sample_test_case() -> "LLMTestCase":
+    """Create a sample test case for demonstration.
 
-    - Standardize citation formatting - currently mixing MLA and APA styles
+    The sample (three graders' feedback and a synthesis constrained to 3-4
+    items per category) lives in SAMPLE_CASE_FILE and is only read here.
     """
+    from deepeval.test_case import LLMTestCase
 
+    sample = orjson.loads(SAMPLE_CASE_FILE.read_bytes())
     return LLMTestCase(
-        input=original_feedback,
-        actual_output=synthesized_feedback,
+        input=preprocess_feedback(sample["original_feedback"]),
+        actual_output=sample["synthesized_feedback"],
     )
 
 
@@ -296,6 +141,14 @@ def create_sample_test_case() -> LLMTestCase:
 # -----------------------------------------------------------------------------
 
 
+def interrupted_run_start() -> int | None:
+    """Start time (epoch seconds) of a run that didn't finish, if any."""
+    try:
+        return int(RUN_MARKER.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
 def main():
     """Run the evaluation."""
     # Check for API key early
@@ -305,20 +158,54 @@ def main():
         print("Set it with: export OPENROUTER_API_KEY=sk-or-...")
         return None
 
+    # DeepEval takes seconds to import, so it waits until the checks above
+    # pass; synthesis_metrics goes first as it turns off DeepEval telemetry
+    from synthesis_metrics import DEFAULT_JUDGE_MODEL, OpenRouterModel, create_metrics
+    from deepeval import evaluate
+    from deepeval.evaluate import AsyncConfig
+
     # Get judge model from env or use default
     judge_model_id = os.environ.get("JUDGE_MODEL", DEFAULT_JUDGE_MODEL)
 
+    # Every judge response is committed to the cache as it lands, which
+    # checkpoints the run. JUDGE_CACHE=1 serves the whole cache; otherwise only
+    # a run that didn't finish is resumed, from the responses recorded since
+    # it started, so earlier completed runs' verdicts are never replayed.
+    full_cache = os.environ.get("JUDGE_CACHE") == "1"
+    started = interrupted_run_start()
+    resuming = started is not None
+    judge_cache = JudgeCache()
+    if not resuming:
+        started = int(time.time())
+        RUN_MARKER.write_text(str(started))
+
     # Create OpenRouter model wrapper
-    judge_model = OpenRouterModel(model=judge_model_id, api_key=api_key)
+    judge_model = OpenRouterModel(
+        model=judge_model_id,
+        api_key=api_key,
+        cache=judge_cache,
+        reuse_cached=resuming or full_cache,
+        cached_since=0 if full_cache else started,
+    )
 
     # Create metrics with the judge model
-    metrics = create_metrics(judge_model)
+    metrics = create_metrics(
+        judge_model,
+        combined=os.environ.get("COMBINED_JUDGE") == "1",
+        batch_size=int(os.environ.get("JUDGE_BATCH_SIZE", "1")),
+    )
 
     print("=" * 60)
     print("SYNTHESIS QUALITY EVALUATION")
     print("=" * 60)
     print(f"Judge model: {judge_model_id}")
     print(f"Metrics: {[m.name for m in metrics]}")
+    if full_cache:
+        print(f"Judge cache: {judge_cache.path}")
+    elif resuming:
+        print(f"Judge cache: {judge_cache.path} (resuming an interrupted run)")
+    else:
+        print("Judge cache: recording only (set JUDGE_CACHE=1 to reuse across runs)")
     print("=" * 60)
 
     # Check for data file or use sample
@@ -336,22 +223,46 @@ def main():
     print(f"Test cases: {len(test_cases)}")
     print("-" * 60)
 
-    # Run evaluation
-    results = evaluate(test_cases, metrics)
+    # Run evaluation - async so judge calls fan out through a_generate
+    try:
+        results = evaluate(
+            test_cases,
+            metrics,
+            async_config=AsyncConfig(run_async=True, max_concurrent=MAX_CONCURRENT, throttle_value=0),
+        )
+    except Exception as e:
+        # A network failure (or Ctrl-C, which isn't an Exception) keeps the
+        # marker so the next run resumes. Anything else, e.g. a judge reply
+        # DeepEval rejected, would fail the same way again, so the next run
+        # starts afresh.
+        if not isinstance(e, (aiohttp.ClientError, OSError)):
+            RUN_MARKER.unlink(missing_ok=True)
+        raise
+    finally:
+        # evaluate() leaves its loop idle, with the judge session still open
+        close_idle_sessions()
+        judge_model.close()
+        judge_cache.close()
+    RUN_MARKER.unlink()
 
     # Summary
     print("\n" + "=" * 60)
     print("RESULTS SUMMARY")
     print("=" * 60)
 
+    # Scores come back on the evaluation results (keyed by the metric's
+    # display name), not on the test cases; one pass groups them by metric.
+    # Metrics that errored have no score and are left out of the average.
+    scores: dict[str, list[float]] = {metric.__name__: [] for metric in metrics}
+    for test_result in results.test_results:
+        for metric_data in test_result.metrics_data or []:
+            if metric_data.score is not None:
+                scores.setdefault(metric_data.name, []).append(metric_data.score)
+
     for metric in metrics:
-        scores = [
-            tc.metrics_metadata.get(metric.name, {}).get("score", 0)
-            for tc in test_cases
-            if hasattr(tc, "metrics_metadata")
-        ]
-        if scores:
-            avg = sum(scores) / len(scores)
+        metric_scores = scores[metric.__name__]
+        if metric_scores:
+            avg = sum(metric_scores) / len(metric_scores)
             print(f"{metric.name}: {avg:.2f} (threshold: {metric.threshold})")
 
     return results
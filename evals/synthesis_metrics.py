@@ -0,0 +1,370 @@
+"""
+Judge model and metrics for the synthesis quality evaluation.
+
+OpenRouterModel is the DeepEval judge wrapper around OpenRouter;
+create_metrics builds the Selection and Quality metrics that
+synthesis_eval.py runs. Kept out of the script so it only imports DeepEval
+(several seconds) once it is actually going to evaluate.
+"""
+
+import asyncio
+import os
+from typing import Optional
+
+import aiohttp
+
+# Disable telemetry before importing deepeval
+os.environ["DEEPEVAL_TELEMETRY"] = "false"
+
+from deepeval.metrics import BaseMetric, GEval
+from deepeval.metrics.utils import trimAndLoadJson
+from deepeval.models import DeepEvalBaseLLM
+from deepeval.test_case import LLMTestCase, LLMTestCaseParams
+from pydantic import BaseModel, create_model
+
+from openrouter import (
+    OPENROUTER_API_URL,
+    JudgeCache,
+    JudgeModelCache,
+    LoopLimiters,
+    close_sync_session,
+    json_schema_format,
+    post_with_retry,
+    read_judge_content,
+    run_sync,
+)
+
+# Default judge model - best models for evaluation
+DEFAULT_JUDGE_MODEL = "anthropic/claude-opus-4.5"
+
+# How long a CombinedJudge batch waits for more test cases before it is sent
+BATCH_LINGER_SECONDS = 0.05
+
+
+# -----------------------------------------------------------------------------
+# OpenRouter Model Wrapper
+# -----------------------------------------------------------------------------
+
+
+class OpenRouterModel(DeepEvalBaseLLM):
+    """Custom DeepEval model wrapper for OpenRouter API."""
+
+    def __init__(
+        self,
+        model: str = DEFAULT_JUDGE_MODEL,
+        api_key: Optional[str] = None,
+        use_json_schema: bool = False,
+        cache: Optional[JudgeCache] = None,
+        reuse_cached: bool = True,
+        cached_since: int = 0,
+    ):
+        self.model_name = model
+        # GEval's prompts already ask for JSON and DeepEval parses the text,
+        # so provider-side schema enforcement is opt-in
+        self.use_json_schema = use_json_schema
+        # None disables the response cache; with reuse_cached=False responses
+        # are only recorded, not served, and only responses recorded at or
+        # after cached_since (epoch seconds) are served
+        self.cache = JudgeModelCache(cache, model, reuse=reuse_cached, since=cached_since)
+        self.max_concurrent = int(os.environ.get("OPENROUTER_MAX_CONCURRENT", "16"))
+        # Adaptive request limit per event loop, created on first async call
+        self._limiters = LoopLimiters(self.max_concurrent)
+        self.api_key = api_key or os.environ.get("OPENROUTER_API_KEY")
+        if not self.api_key:
+            raise ValueError(
+                "OPENROUTER_API_KEY environment variable is required. "
+                "Set it with: export OPENROUTER_API_KEY=sk-or-..."
+            )
+
+        # Request pieces that never change between calls
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://markm8.com",
+            "X-Title": "MarkM8 Evals",
+        }
+        self._base_payload = {
+            "model": self.model_name,
+            "temperature": 0.1,  # Low temperature for consistent evaluation
+        }
+        # Route to the fastest upstream provider rather than OpenRouter's default
+        provider_sort = os.environ.get("OPENROUTER_PROVIDER_SORT", "throughput")
+        if provider_sort:
+            self._base_payload["provider"] = {"sort": provider_sort}
+
+    def load_model(self):
+        """Return the model identifier."""
+        return self.model_name
+
+    def generate(self, prompt: str, schema: Optional[type] = None) -> str:
+        """Synchronous generation via OpenRouter API.
+
+        Runs a_generate on the shared background loop, so both paths use the
+        same session, retry policy and cache.
+        """
+        return run_sync(self.a_generate(prompt, schema))
+
+    async def a_generate(self, prompt: str, schema: Optional[type] = None) -> str:
+        """Asynchronous generation via OpenRouter API."""
+        # Debug: log the prompt being sent
+        if os.environ.get("DEBUG_PROMPTS"):
+            print("\n" + "=" * 80)
+            print("PROMPT SENT TO JUDGE MODEL:")
+            print("=" * 80)
+            print(prompt)
+            print("=" * 80 + "\n")
+
+        key = self.cache.key(prompt)
+        cached = self.cache.get(key, schema)
+        if cached is not None:
+            return cached
+
+        payload = {
+            **self._base_payload,
+            "stream": True,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+        if schema is not None and self.use_json_schema:
+            payload["response_format"] = json_schema_format(schema)
+
+        # Shared pooled session, so concurrent judge calls reuse warm connections;
+        # 429/5xx/connection errors are retried with backoff, and the limiter
+        # caps requests in flight
+        limiter = self._limiters.get()
+        async with limiter, post_with_retry(
+            OPENROUTER_API_URL,
+            label=f"judge {self.model_name}",
+            limiter=limiter,
+            headers=self.headers,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=120),
+        ) as response:
+            # Streamed, so only the verdict text is accumulated and reading
+            # stops once its JSON closes
+            content = await read_judge_content(response, label=f"judge {self.model_name}")
+        self.cache.put(key, content, schema)
+        return content
+
+    def get_model_name(self) -> str:
+        """Return the model identifier."""
+        return self.model_name
+
+    def close(self):
+        """Close the session used by sync callers; it reopens on next use."""
+        close_sync_session()
+
+
+# -----------------------------------------------------------------------------
+# Evaluation Metrics
+# -----------------------------------------------------------------------------
+
+
+# Evaluation steps per criterion, shared by the GEval metrics and CombinedJudge
+CRITERIA = {
+    "Selection": [
+        "Compare the graders' strengths and improvements in the Input with the points kept in the Actual Output",
+        "Reward keeping the points with the most impact on student learning; penalize keeping trivial points or dropping important ones",
+        "Reward points grounded in specific grader evidence rather than generic advice",
+    ],
+    "Quality": [
+        "Read each point in the Actual Output as the student would: is it clear, concise, specific and actionable?",
+        "Reward points that explain WHY something matters, not just WHAT to fix",
+        "Penalize vague platitudes and points that repeat each other",
+    ],
+}
+
+
+class CriterionVerdict(BaseModel):
+    """One criterion's entry in a CombinedJudge reply."""
+
+    score: float
+    reason: Optional[str] = None
+
+
+class CombinedJudge:
+    """Scores every criterion for a test case in a single judge call.
+
+    The CriterionMetric for each criterion asks this judge for its verdict;
+    the first request per test case makes the call and the rest share it, so
+    scoring N criteria costs one request instead of N.
+
+    With `batch_size` > 1, async requests arriving within
+    BATCH_LINGER_SECONDS of each other are also grouped, up to `batch_size`
+    test cases per call.
+    """
+
+    def __init__(self, model: DeepEvalBaseLLM, criteria: dict[str, list[str]], batch_size: int = 1):
+        self.model = model
+        self.criteria = criteria
+        self.batch_size = batch_size
+        # The criteria are fixed, so the instructions are rendered once
+        steps = "\n\n".join(
+            f"{name}:\n" + "\n".join(f"{i}. {step}" for i, step in enumerate(criterion, 1))
+            for name, criterion in criteria.items()
+        )
+        self._reply = "{" + ", ".join(
+            f'"{name}": {{"score": <0-10>, "reason": "<one sentence>"}}' for name in criteria
+        ) + "}"
+        self._steps = (
+            "You are evaluating an AI-generated synthesis (Actual Output) of several "
+            "graders' feedback (Input). Score the Actual Output on each criterion below "
+            "by following its evaluation steps.\n\n"
+            f"{steps}"
+        )
+        # Reply shapes, passed to the model so it only caches replies that fit
+        self._schema = create_model(
+            "CombinedVerdict", **{name: (CriterionVerdict, ...) for name in criteria}
+        )
+        self._batch_schema = create_model("CombinedBatchVerdict", cases=(list[self._schema], ...))
+        self._verdicts: dict[tuple[str, str], dict] = {}
+        self._pending: dict[tuple[str, str], asyncio.Future] = {}
+        # Test cases waiting for the next batched call, and its flush timer
+        self._batch: list[tuple[tuple[str, str], LLMTestCase, asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: set[asyncio.Task] = set()
+
+    def _prompt(self, test_case: LLMTestCase) -> str:
+        return (
+            f"{self._steps}\n\nReturn only a JSON object of the form {self._reply}."
+            f"\n\nInput:\n{test_case.input}\n\nActual Output:\n{test_case.actual_output}"
+        )
+
+    def _batch_prompt(self, test_cases: list[LLMTestCase]) -> str:
+        cases = "\n\n".join(
+            f"Test case {i}:\nInput:\n{tc.input}\n\nActual Output:\n{tc.actual_output}"
+            for i, tc in enumerate(test_cases, 1)
+        )
+        return (
+            f"{self._steps}\n\nThere are {len(test_cases)} test cases below; score each "
+            f'independently. Return only a JSON object of the form {{"cases": [{self._reply}, ...]}} '
+            f"with one entry per test case, in order.\n\n{cases}"
+        )
+
+    def _parse(self, data: dict) -> dict:
+        return {name: data[name] for name in self.criteria}
+
+    def verdict(self, test_case: LLMTestCase) -> dict:
+        """Scores for every criterion, keyed by criterion name (sync path)."""
+        key = (test_case.input, test_case.actual_output)
+        if key not in self._verdicts:
+            content = self.model.generate(self._prompt(test_case), schema=self._schema)
+            self._verdicts[key] = self._parse(trimAndLoadJson(content))
+        return self._verdicts[key]
+
+    async def a_verdict(self, test_case: LLMTestCase) -> dict:
+        """Scores for every criterion, keyed by criterion name."""
+        key = (test_case.input, test_case.actual_output)
+        verdict = self._verdicts.get(key)
+        if verdict is not None:
+            return verdict
+
+        # Criteria measured concurrently share one in-flight call
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = loop.create_future()
+            self._batch.append((key, test_case, future))
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+            elif self._flush_timer is None:
+                self._flush_timer = loop.call_later(BATCH_LINGER_SECONDS, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._batch = self._batch, []
+        task = asyncio.ensure_future(self._judge(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _judge(self, batch: list[tuple[tuple[str, str], LLMTestCase, asyncio.Future]]):
+        try:
+            if len(batch) == 1:
+                content = await self.model.a_generate(self._prompt(batch[0][1]), schema=self._schema)
+                results = [trimAndLoadJson(content)]
+            else:
+                content = await self.model.a_generate(
+                    self._batch_prompt([tc for _, tc, _ in batch]), schema=self._batch_schema
+                )
+                results = trimAndLoadJson(content)["cases"]
+                if len(results) != len(batch):
+                    raise ValueError(f"judge scored {len(results)} of {len(batch)} batched test cases")
+            verdicts = [self._parse(data) for data in results]
+        except Exception as e:
+            for key, _, future in batch:
+                del self._pending[key]
+                future.set_exception(e)
+            return
+        for (key, _, future), verdict in zip(batch, verdicts):
+            self._verdicts[key] = verdict
+            del self._pending[key]
+            future.set_result(verdict)
+
+
+class CriterionMetric(BaseMetric):
+    """One criterion's score, read from a CombinedJudge verdict."""
+
+    def __init__(self, name: str, judge: CombinedJudge, threshold: float = 0.6):
+        self.name = name
+        self.judge = judge
+        self.threshold = threshold
+        self.evaluation_model = judge.model.get_model_name()
+
+    def measure(self, test_case: LLMTestCase, *args, **kwargs) -> float:
+        return self._record(self.judge.verdict(test_case))
+
+    async def a_measure(self, test_case: LLMTestCase, *args, **kwargs) -> float:
+        return self._record(await self.judge.a_verdict(test_case))
+
+    def _record(self, verdict: dict) -> float:
+        result = verdict[self.name]
+        # Same 0-10 scale as GEval, normalized to 0-1
+        self.score = float(result["score"]) / 10
+        self.reason = result.get("reason")
+        self.success = self.score >= self.threshold
+        return self.score
+
+    def is_successful(self) -> bool:
+        return bool(self.success)
+
+    @property
+    def __name__(self):
+        return f"{self.name} [Combined]"
+
+
+def create_metrics(
+    model: DeepEvalBaseLLM,
+    combined: bool = False,
+    batch_size: int = 1,
+) -> list[BaseMetric]:
+    """
+    Create evaluation metrics using the provided judge model.
+
+    Context: The synthesis takes feedback from multiple graders and distills it
+    into a FIXED number of points. This means some feedback will be dropped.
+    The goal is to keep the MOST relevant, impactful, and helpful feedback.
+
+    Two metrics:
+    1. Selection - Did it pick the RIGHT points to include?
+    2. Quality - Is the output well-written and actionable?
+
+    With `combined`, both are scored by one CombinedJudge call per test case
+    instead of one GEval call each, or per `batch_size` test cases.
+    """
+    if combined:
+        judge = CombinedJudge(model, CRITERIA, batch_size=batch_size)
+        return [CriterionMetric(name, judge, threshold=0.6) for name in CRITERIA]
+
+    return [
+        GEval(
+            name=name,
+            evaluation_steps=steps,
+            evaluation_params=[LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT],
+            threshold=0.6,
+            model=model,
+        )
+        for name, steps in CRITERIA.items()
+    ]
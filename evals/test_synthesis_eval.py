@@ -0,0 +1,47 @@
+"""Tests for synthesis_eval's grader feedback preprocessing.
+
+Run with: uv run pytest test_synthesis_eval.py
+"""
+
+import orjson
+
+from synthesis_eval import preprocess_feedback
+
+
+def test_preprocess_feedback_json_body():
+    feedback = {
+        "strengths": [{"title": "Strong Thesis", "evidence": "The \"two-pronged\" argument."}],
+        "improvements": [{"title": "Quote Integration", "suggestion": "Weave quotes in."}],
+    }
+    xml = (
+        '<grader_1 model="grok-4" percentage="72">\n'
+        f"{orjson.dumps(feedback, option=orjson.OPT_INDENT_2).decode()}\n"
+        "</grader_1>"
+    )
+
+    assert orjson.loads(preprocess_feedback(xml)) == [
+        {"grader": 1, "model": "grok-4", "percentage": "72", **feedback}
+    ]
+
+
+def test_preprocess_feedback_text_body():
+    xml = (
+        '<grader_2 model="gpt-5" percentage="68">\n'
+        "Strengths:\n- Clear thesis\n- Good evidence\n"
+        "Improvements:\n- Weak conclusion\n"
+        "</grader_2>"
+    )
+
+    assert orjson.loads(preprocess_feedback(xml)) == [
+        {
+            "grader": 2,
+            "model": "gpt-5",
+            "percentage": "68",
+            "strengths": ["Clear thesis", "Good evidence"],
+            "improvements": ["Weak conclusion"],
+        }
+    ]
+
+
+def test_preprocess_feedback_without_grader_blocks():
+    assert preprocess_feedback("Just some notes") == "Just some notes"